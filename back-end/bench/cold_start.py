@@ -0,0 +1,88 @@
+"""
+Cold start check: how long a fresh process takes to import the app and how long
+`python main.py` takes to answer its first request. Fails when the median time to
+ready goes over --target-ms.
+
+    python -m bench.cold_start --runs 5 --workers 2 --target-ms 3000
+
+Each run starts from an empty SQLite database in a temporary directory, so the time
+includes creating and seeding it.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from bench.load import BACKEND_DIR, free_port, stop
+
+
+def import_ms(module: str) -> float:
+    code = f"import time; t = time.perf_counter(); import {module}; print((time.perf_counter() - t) * 1000)"
+    output = subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, check=True,
+        env=dict(os.environ, DATABASE_URL=f"sqlite:///{tempfile.mkdtemp(prefix='soda-cold-')}/cold.db"),
+    ).stdout
+    return float(output.strip().splitlines()[-1])
+
+
+def ready_ms(workers: int, timeout: float) -> float:
+    port = free_port()
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(tempfile.mkdtemp(prefix='soda-cold-'), 'cold.db')}",
+        APP_ENV="production",
+        PORT=str(port),
+        HOST="127.0.0.1",
+        WEB_CONCURRENCY=str(workers),
+        UVICORN_LOG_LEVEL="warning",
+        OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "unused"),
+    )
+    env.pop("DATABASE_READ_URL", None)
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "main.py"], cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}/products/", timeout=1).status_code == 200:
+                    return (time.perf_counter() - started) * 1000
+            except httpx.HTTPError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("the server exited during startup")
+            time.sleep(0.02)
+        raise RuntimeError(f"not ready after {timeout}s")
+    finally:
+        stop([server])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--target-ms", type=float, default=3000, help="allowed median time until the first answer")
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    app_imports = [import_ms("src") for _ in range(args.runs)]
+    agent_imports = [import_ms("src.agent.ai_agent") for _ in range(args.runs)]
+    ready = [ready_ms(args.workers, args.timeout) for _ in range(args.runs)]
+
+    print(f"import src (app, agent left out)  median {statistics.median(app_imports):8.0f} ms")
+    print(f"import src.agent.ai_agent          median {statistics.median(agent_imports):8.0f} ms  (loaded in a thread after startup)")
+    print(f"main.py, {args.workers} worker(s), to first 200  median {statistics.median(ready):8.0f} ms  max {max(ready):.0f} ms")
+
+    if statistics.median(ready) > args.target_ms:
+        print(f"FAILED: cold start is over the {args.target_ms:.0f} ms target")
+        sys.exit(1)
+    print(f"OK: under the {args.target_ms:.0f} ms target")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+"""
+Offline stand-in for the OpenAI chat completions API, for benchmarks and local runs
+without a real model. Point the app at it with LLM_BASE_URL:
+
+    python -m bench.fake_llm --port 9000 --latency-ms 300 --jitter-ms 100 --error-rate 0.02
+    LLM_BASE_URL=http://localhost:9000/v1 LLM_MODEL=fake OPENAI_API_KEY=x python main.py
+
+Answers are deterministic. The requested structure is read from the JSON schema that
+instructor puts in the system prompt (UserIntent, QualityCheck or FreeChat), and a
+simple keyword classifier fills it in. Latency and failures come from a generator
+seeded with --seed and the request content, so a given sequence of requests behaves
+the same way on every run. stream=true is answered with server-sent chunks.
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+from collections import Counter
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+NUMBERS = {"a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5}
+BUY_WORDS = {"buy", "want", "order", "get", "give", "purchase", "take"}
+INFO_WORDS = {"stock", "available", "menu", "inventory", "price", "prices", "have"}
+
+
+def classify(text: str) -> dict:
+    """A UserIntent-shaped answer for a user message."""
+    words = re.findall(r"[a-z0-9]+", text.lower())
+    if "most" in words or "popular" in words or "best" in words:
+        return {"action": "most_sold", "orders": None, "message": None}
+    if BUY_WORDS & set(words):
+        orders = []
+        for index, word in enumerate(words[:-1]):
+            quantity = int(word) if word.isdigit() else NUMBERS.get(word)
+            if quantity:
+                name = words[index + 1]
+                orders.append({"soda_name": name[:-1] if name.endswith("s") and len(name) > 3 else name, "quantity": quantity})
+        if orders:
+            return {"action": "buy", "orders": orders, "message": text}
+    if INFO_WORDS & set(words):
+        return {"action": "info", "orders": None, "message": None}
+    return {"action": "chat", "orders": None, "message": text}
+
+
+def answer(system: str, user: str, words: int) -> dict:
+    if '"orders"' in system:
+        return classify(user)
+    if '"valid"' in system:
+        return {"context": "checked by the fake model", "valid": True}
+    filler = ("Thanks for asking! Here is a friendly answer from the offline test model "
+              "so that benchmarks have something realistic to stream back to the client. ").split()
+    text = " ".join((filler * (words // len(filler) + 1))[:words])
+    return {"message": f"{text} (about: {user[:60].strip()})"}
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Fake LLM")
+    seen = Counter()
+
+    def rng_for(body: bytes) -> random.Random:
+        digest = hashlib.sha256(body).hexdigest()
+        seen[digest] += 1
+        return random.Random(f"{args.seed}:{digest}:{seen[digest]}")
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.body()
+        payload = json.loads(body)
+        rng = rng_for(body)
+        await asyncio.sleep(max(0.0, rng.gauss(args.latency_ms, args.jitter_ms)) / 1000)
+        if rng.random() < args.error_rate:
+            return JSONResponse(
+                status_code=args.error_status,
+                content={"error": {"message": "fake failure", "type": "server_error"}},
+            )
+
+        messages = payload.get("messages", [])
+        system = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "system")
+        user = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user")
+        content = json.dumps(answer(system, user, args.words))
+        model = payload.get("model", "fake")
+        usage = {
+            "prompt_tokens": len((system + user).split()),
+            "completion_tokens": len(content.split()),
+            "total_tokens": len((system + user).split()) + len(content.split()),
+        }
+        created = int(time.time())
+
+        if not payload.get("stream"):
+            return {
+                "id": f"fake-{rng.getrandbits(32):08x}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+                "usage": usage,
+            }
+
+        async def chunks():
+            chunk_id = f"fake-{rng.getrandbits(32):08x}"
+            pieces = re.findall(r"\S+\s*", content)
+            for index, piece in enumerate(pieces):
+                if index and args.token_ms:
+                    await asyncio.sleep(args.token_ms / 1000)
+                delta = {"index": 0, "delta": {"content": piece}, "finish_reason": None}
+                yield "data: " + json.dumps({
+                    "id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [delta],
+                }) + "\n\n"
+            done = {"index": 0, "delta": {}, "finish_reason": "stop"}
+            yield "data: " + json.dumps({
+                "id": chunk_id, "object": "chat.completion.chunk", "created": created, "model": model, "choices": [done],
+            }) + "\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(chunks(), media_type="text/event-stream")
+
+    return app
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-ms", type=float, default=200, help="mean time before the answer starts")
+    parser.add_argument("--jitter-ms", type=float, default=50, help="standard deviation of that time")
+    parser.add_argument("--token-ms", type=float, default=20, help="delay between streamed chunks")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with an error")
+    parser.add_argument("--error-status", type=int, default=500)
+    parser.add_argument("--words", type=int, default=40, help="length of free chat answers")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    uvicorn.run(create_app(args), host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
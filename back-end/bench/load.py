@@ -0,0 +1,258 @@
+"""
+Load harness for the API: drives /ask, /products/, /sales/ and /sales/most_sold/ at a
+fixed concurrency and reports p50/p95/p99 latency, throughput and errors per scenario.
+
+    python -m bench.load --spawn                                  # fake LLM + app on a scratch db
+    python -m bench.load --base-url http://localhost:8000 --scenarios products,most_sold
+    python -m bench.load --spawn --save-baseline                  # record bench/baselines.json
+    python -m bench.load --spawn --compare                        # exit 1 on a regression
+
+--spawn starts bench/fake_llm.py and the app (uvicorn src:app) as subprocesses
+against a throwaway SQLite database. Runs are then reproducible and cost nothing.
+Baselines are stored per --baseline-name. A run regresses when p95 grows, or
+throughput drops, by more than --tolerance.
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from itertools import count
+
+import httpx
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+BENCH_PRODUCT = "bench-soda"
+
+ASK_MESSAGES = [
+    "buy 2 cokes",
+    "what do you have in stock?",
+    "what is the most sold soda?",
+    "hello, could you tell me a fun fact about soda?",
+    "i want one fanta and two pepsis",
+    "which drinks are available",
+]
+
+SCENARIOS = {
+    "ask": lambda i: ("POST", "/ask", {"message": ASK_MESSAGES[i % len(ASK_MESSAGES)]}),
+    "products": lambda i: ("GET", "/products/", None),
+    "sales": lambda i: ("GET", "/sales/?limit=100", None),
+    "most_sold": lambda i: ("GET", "/sales/most_sold/", None),
+    "buy": lambda i: ("POST", "/sales/", {"product_name": BENCH_PRODUCT, "quantity": 1}),
+}
+
+
+def percentile(values, p: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not values:
+        return 0.0
+    return values[max(0, math.ceil(p / 100 * len(values)) - 1)]
+
+
+async def run_scenario(client: httpx.AsyncClient, name: str, requests: int, concurrency: int) -> dict:
+    make_request = SCENARIOS[name]
+    numbers = count()
+    latencies, errors = [], 0
+
+    async def worker():
+        nonlocal errors
+        while (i := next(numbers)) < requests:
+            method, path, body = make_request(i)
+            started = time.perf_counter()
+            try:
+                response = await client.request(method, path, json=body)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            latencies.append(time.perf_counter() - started)
+            errors += failed
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        "requests": requests,
+        "errors": errors,
+        "rps": round(requests / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run(args) -> dict:
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=args.timeout, limits=limits) as client:
+        if "buy" in args.scenarios:
+            response = await client.post("/products/", json={"name": BENCH_PRODUCT, "stock": 10 ** 9, "price": 1})
+            response.raise_for_status()
+        results = {}
+        for name in args.scenarios:
+            await run_scenario(client, name, min(args.warmup, args.requests), args.concurrency)
+            results[name] = await run_scenario(client, name, args.requests, args.concurrency)
+            print_row(name, results[name])
+        return results
+
+
+def print_row(name: str, stats: dict):
+    print(
+        f"{name:<10}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>10.1f}"
+        f"{stats['p50_ms']:>10.1f}{stats['p95_ms']:>10.1f}{stats['p99_ms']:>10.1f}"
+    )
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(url: str, timeout: float = 30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(url, timeout=1)
+            return
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+def spawn(args):
+    """Starts the fake LLM and the app; returns the processes to stop afterwards."""
+    llm_port, app_port = free_port(), free_port()
+    scratch = tempfile.mkdtemp(prefix="soda-load-")
+    llm = subprocess.Popen(
+        [
+            sys.executable, "-m", "bench.fake_llm", "--port", str(llm_port),
+            "--latency-ms", str(args.llm_latency_ms), "--jitter-ms", str(args.llm_jitter_ms),
+            "--error-rate", str(args.llm_error_rate), "--seed", str(args.seed),
+        ],
+        cwd=BACKEND_DIR,
+    )
+    env = dict(
+        os.environ,
+        DATABASE_URL=f"sqlite:///{os.path.join(scratch, 'bench.db')}",
+        LLM_BASE_URL=f"http://127.0.0.1:{llm_port}/v1",
+        LLM_MODEL="fake",
+        OPENAI_API_KEY="fake",
+        LOG_LEVEL=os.environ.get("LOG_LEVEL", "warn"),
+    )
+    env.pop("DATABASE_READ_URL", None)
+    app = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "src:app", "--port", str(app_port), "--log-level", "warning", "--no-access-log"],
+        cwd=BACKEND_DIR,
+        env=env,
+    )
+    processes = [app, llm]
+    try:
+        wait_until_up(f"http://127.0.0.1:{llm_port}/docs")
+        wait_until_up(f"http://127.0.0.1:{app_port}/products/")
+    except Exception:
+        stop(processes)
+        raise
+    args.base_url = f"http://127.0.0.1:{app_port}"
+    return processes
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    regressions = []
+    for name, stats in results.items():
+        before = baseline.get(name)
+        if before is None:
+            continue
+        if before["p95_ms"] and (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] > tolerance:
+            regressions.append(f"{name}: p95 {before['p95_ms']} -> {stats['p95_ms']} ms")
+        if before["rps"] and (before["rps"] - stats["rps"]) / before["rps"] > tolerance:
+            regressions.append(f"{name}: rps {before['rps']} -> {stats['rps']}")
+        if stats["errors"] > before["errors"] and stats["errors"] / stats["requests"] > tolerance / 10:
+            regressions.append(f"{name}: errors {before['errors']} -> {stats['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--spawn", action="store_true", help="start the fake LLM and the app for this run")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"comma separated, from {', '.join(SCENARIOS)}")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests before each scenario")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--llm-latency-ms", type=float, default=200)
+    parser.add_argument("--llm-jitter-ms", type=float, default=50)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--baseline-file", default=os.path.join(BENCH_DIR, "baselines.json"))
+    parser.add_argument("--baseline-name", default="default")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--compare", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    processes = spawn(args) if args.spawn else []
+    try:
+        print(f"{args.base_url}, concurrency {args.concurrency}, {args.requests} requests per scenario\n")
+        print(f"{'scenario':<10}{'requests':>9}{'errors':>8}{'rps':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+        results = asyncio.run(run(args))
+    finally:
+        stop(processes)
+
+    baselines = {}
+    if os.path.exists(args.baseline_file):
+        with open(args.baseline_file) as f:
+            baselines = json.load(f)
+
+    if args.compare:
+        baseline = baselines.get(args.baseline_name)
+        if baseline is None:
+            print(f"\nno baseline named {args.baseline_name!r} in {args.baseline_file}")
+            sys.exit(1)
+        regressions = compare(results, baseline["results"], args.tolerance)
+        if regressions:
+            print("\nREGRESSED:\n  " + "\n  ".join(regressions))
+            sys.exit(1)
+        print(f"\nOK: within {args.tolerance:.0%} of baseline {args.baseline_name!r}")
+
+    if args.save_baseline:
+        baselines[args.baseline_name] = {
+            "recorded_at": datetime.now(timezone.utc).isoformat(),
+            "config": {
+                "concurrency": args.concurrency,
+                "requests": args.requests,
+                "spawned": args.spawn,
+                "llm_latency_ms": args.llm_latency_ms,
+                "llm_error_rate": args.llm_error_rate,
+                "seed": args.seed,
+            },
+            "results": results,
+        }
+        with open(args.baseline_file, "w") as f:
+            json.dump(baselines, f, indent=2)
+        print(f"\nbaseline {args.baseline_name!r} saved to {args.baseline_file}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+"""
+Compares the sales read paths: the old way (ORM objects for every sale plus the whole
+product table turned into an id->name dict in Python) against the SQL joins the
+service layer uses now. Reports wall time, CPU time and peak allocations per call.
+
+    python -m bench.sales_queries --products 2000 --sales 50000 --repeat 20
+
+Builds a throwaway SQLite database in a temporary directory.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta, timezone
+
+os.chdir(tempfile.mkdtemp(prefix="soda-bench-"))
+os.environ["DATABASE_URL"] = "sqlite:///./bench.db"
+os.environ.pop("DATABASE_READ_URL", None)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import func  # noqa: E402
+from sqlmodel import Session, insert, select  # noqa: E402
+
+from src import services  # noqa: E402
+from src.models import MostSoldItem, Product, Sale, SaleOut, create_db_and_tables, engine, rebuild_sales_aggregate  # noqa: E402
+
+
+def python_join_list_sales(session: Session, skip: int, limit: int):
+    sales = session.exec(select(Sale).offset(skip).limit(limit)).all()
+    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
+    return [
+        SaleOut(id=s.id, product_name=product_map.get(s.product_id, "Unknown"), timestamp=s.timestamp, quantity=s.quantity)
+        for s in sales
+    ]
+
+
+def python_join_history(session: Session):
+    sales = session.exec(select(Sale).order_by(Sale.timestamp, Sale.id)).all()
+    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
+    return [
+        SaleOut(id=s.id, product_name=product_map.get(s.product_id, "Unknown"), timestamp=s.timestamp, quantity=s.quantity)
+        for s in sales
+    ]
+
+
+def python_join_most_sold(session: Session):
+    rows = session.exec(select(Sale.product_id, func.sum(Sale.quantity)).group_by(Sale.product_id)).all()
+    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
+    items = [MostSoldItem(product_name=product_map.get(pid, "Unknown"), total_sold=total) for pid, total in rows]
+    return sorted(items, key=lambda item: item.total_sold, reverse=True)
+
+
+def populate(products: int, sales: int):
+    create_db_and_tables()
+    rng = random.Random(13)
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with Session(engine) as session:
+        session.exec(insert(Product), params=[
+            {"name": f"soda-{i}", "stock": 1000, "price": 5} for i in range(products)
+        ])
+        session.exec(insert(Sale), params=[
+            {
+                "product_id": rng.randint(1, products),
+                "quantity": rng.randint(1, 5),
+                "timestamp": start + timedelta(seconds=i * 30),
+            }
+            for i in range(sales)
+        ])
+        session.commit()
+        rebuild_sales_aggregate(session)
+
+
+def measure(fn, repeat: int):
+    with Session(engine) as session:
+        fn(session)  # warm up caches and compiled statements
+    wall = cpu = 0.0
+    for _ in range(repeat):
+        with Session(engine) as session:
+            started, started_cpu = time.perf_counter(), time.process_time()
+            fn(session)
+            wall += time.perf_counter() - started
+            cpu += time.process_time() - started_cpu
+    with Session(engine) as session:
+        tracemalloc.start()
+        fn(session)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return wall / repeat * 1000, cpu / repeat * 1000, peak / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--products", type=int, default=2000)
+    parser.add_argument("--sales", type=int, default=50000)
+    parser.add_argument("--page", type=int, default=100, help="page size for the /sales/ listing")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    populate(args.products, args.sales)
+    print(f"{args.products} products, {args.sales} sales, {args.repeat} runs each\n")
+
+    cases = [
+        ("list_sales", lambda s: python_join_list_sales(s, 0, args.page), lambda s: services.list_sales(s, 0, args.page)),
+        ("sale_history", python_join_history, services.sale_history),
+        ("most_sold", python_join_most_sold, services.most_sold),
+    ]
+    print(f"{'query':<14}{'path':<13}{'wall ms':>10}{'cpu ms':>10}{'peak KiB':>11}")
+    for name, old, new in cases:
+        for label, fn in (("python join", old), ("sql join", new)):
+            wall, cpu, peak = measure(fn, args.repeat)
+            print(f"{name:<14}{label:<13}{wall:>10.2f}{cpu:>10.2f}{peak:>11.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Concurrency stress check for the stock decrement: fires many parallel one-unit
+purchases at a product with less stock than requests and verifies nothing is oversold.
+tests/test_sales_concurrency.py runs a small version with the test suite; this script
+is for larger runs and other databases.
+
+    python -m bench.stress_sales --purchases 500 --stock 100 --workers 64
+
+Runs against a throwaway SQLite database in a temporary directory unless DATABASE_URL
+points somewhere else (e.g. a local PostgreSQL); each run uses a product of its own.
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+os.chdir(tempfile.mkdtemp(prefix="soda-stress-"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlmodel import Session, func, select  # noqa: E402
+
+from src import services  # noqa: E402
+from src.models import Product, ProductCreate, Sale, SaleCreate, check_sales_aggregate, create_db_and_tables, engine  # noqa: E402
+
+
+def purchase(product_name: str):
+    with Session(engine) as session:
+        try:
+            services.create_sale(session, SaleCreate(product_name=product_name, quantity=1))
+            return "sold"
+        except services.ServiceError as e:
+            return e.detail
+        except Exception as e:
+            return f"error: {e}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--purchases", type=int, default=500)
+    parser.add_argument("--stock", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=64)
+    args = parser.parse_args()
+
+    product_name = f"stress-cola-{uuid.uuid4().hex[:8]}"
+    create_db_and_tables()
+    with Session(engine) as session:
+        product = services.create_product(session, ProductCreate(name=product_name, stock=args.stock, price=1))
+        product_id = product.id
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        outcomes = list(pool.map(purchase, [product_name] * args.purchases))
+    elapsed = time.perf_counter() - started
+
+    with Session(engine) as session:
+        stock = session.exec(select(Product.stock).where(Product.id == product_id)).one()
+        sold = session.exec(select(func.coalesce(func.sum(Sale.quantity), 0)).where(Sale.product_id == product_id)).one()
+        aggregate = check_sales_aggregate(session)
+
+    counts = {outcome: outcomes.count(outcome) for outcome in set(outcomes)}
+    print(f"{args.purchases} purchases, {args.workers} workers, {elapsed:.2f}s")
+    print(f"outcomes: {counts}")
+    print(f"units sold: {sold}, stock left: {stock}, aggregate consistent: {aggregate.consistent}")
+
+    failures = []
+    if sold > args.stock or stock < 0:
+        failures.append("oversold")
+    if sold + stock != args.stock:
+        failures.append("stock and sales do not add up")
+    if sold != min(args.purchases, args.stock):
+        failures.append("some purchases that had stock were rejected")
+    if any(outcome.startswith("error") for outcome in outcomes):
+        failures.append("unexpected errors")
+    if not aggregate.consistent:
+        failures.append("sales aggregate drifted")
+    if failures:
+        print("FAILED: " + ", ".join(failures))
+        sys.exit(1)
+    print("OK: no oversells")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,40 @@
+import os
+
 import uvicorn
+from dotenv import load_dotenv
+
+load_dotenv()
+
+
+def main():
+    """
+    APP_ENV=development: one process with auto-reload.
+    Otherwise WEB_CONCURRENCY worker processes. The database is initialised once here,
+    before they start, and each worker creates its own agent on first use. On SIGTERM
+    in-flight requests get GRACEFUL_SHUTDOWN_TIMEOUT seconds to finish.
+    """
+    host = os.environ.get("HOST", "0.0.0.0")
+    port = int(os.environ.get("PORT", 8000))
+    if os.environ.get("APP_ENV", "production") == "development":
+        uvicorn.run("src:app", host=host, port=port, reload=True)
+        return
+
+    from src import init_db
+
+    init_db()
+    os.environ["DB_INIT_ON_STARTUP"] = "false"
+    # the workers read the resolved count too, e.g. to share agent sessions between them
+    workers = int(os.environ.get("WEB_CONCURRENCY", min(4, os.cpu_count() or 1)))
+    os.environ["WEB_CONCURRENCY"] = str(workers)
+    uvicorn.run(
+        "src:app",
+        host=host,
+        port=port,
+        workers=workers,
+        timeout_graceful_shutdown=int(os.environ.get("GRACEFUL_SHUTDOWN_TIMEOUT", 20)),
+        log_level=os.environ.get("UVICORN_LOG_LEVEL", "info"),
+    )
+
 
 if __name__ == "__main__":
-    uvicorn.run("src:app", host="0.0.0.0", port=8000, reload=True)
+    main()
@@ -1,20 +1,96 @@
-from fastapi import FastAPI, HTTPException, Depends
-from pydantic import BaseModel
-from sqlmodel import Session, select
-from typing import List
+from fastapi import FastAPI, HTTPException, Depends, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+import anyio
+from sqlmodel import Session
+from typing import List, Literal, Optional
+from datetime import datetime
+import asyncio
+import json
+import threading
+import time
+import uuid
 from .models import (
-    Product, ProductCreate, ProductOut,MostSoldItem,
-    Sale, SaleCreate, SaleOut,
-    engine, create_db_and_tables,
+    ProductCreate, ProductOut,MostSoldItem,
+    SaleCreate, SaleBulkCreate, SaleBatchOut, SaleOut, SalePage, SalesAggregateCheck,
+    engine, read_engine, create_db_and_tables, migrate_sale_quantity, migrate_product_version,
+    backfill_sales_aggregate, check_sales_aggregate, seed_products, env_flag,
     MessageInput,
 )
-from .agent.ai_agent import AIAgent
+from . import services, observability
+from .catalog import catalog
+from .agent.utils.budget import RequestBudget
+from .agent.utils.admission import LLMOverloaded
 from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
 
-    
-app = FastAPI(title="Soda AI API", version="1.0.0")
+INITIAL_PRODUCTS = [
+    {"name": "coke", "stock": 200, "price": 5},
+    {"name": "fanta", "stock": 100, "price": 5},
+    {"name": "pepsi", "stock": 60, "price": 5},
+]
+
+def init_db():
+    """
+    Creates the tables, runs the one-off data migrations and adds the default products
+    that are missing. Products that already exist keep their live stock and price, so
+    running it again is harmless; main.py runs it once before starting the workers.
+    """
+    create_db_and_tables()
+    migrate_sale_quantity()
+    migrate_product_version()
+    backfill_sales_aggregate()
+    added = seed_products(INITIAL_PRODUCTS)
+    catalog.invalidate()
+    print(f"Initial product data loaded successfully ({added} added).")
+
+_agent = None
+_agent_lock = threading.Lock()
+
+def get_agent():
+    """
+    The worker's AIAgent, created on first use so the LLM client and its imports stay
+    out of startup.
+    """
+    global _agent
+    if _agent is None:
+        with _agent_lock:
+            if _agent is None:
+                from .agent.ai_agent import AIAgent
+                _agent = AIAgent()
+    return _agent
+
+async def agent_ready():
+    """get_agent() for async handlers: the first call imports and builds it in a thread, off the event loop."""
+    if _agent is not None:
+        return _agent
+    return await anyio.to_thread.run_sync(get_agent)
+
+def _invalidate_agent_stock_cache():
+    if _agent is not None:
+        _agent.invalidate_stock_cache()
+
+def _agent_stats() -> dict:
+    return _agent.stats() if _agent is not None else {}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # main.py initialises the database once and switches this off for its workers
+    if env_flag("DB_INIT_ON_STARTUP", True):
+        init_db()
+    # build the agent in the background: the worker serves requests straight away and
+    # the first /ask usually finds it ready
+    warm_up = asyncio.create_task(agent_ready())
+    yield
+    await asyncio.gather(warm_up, return_exceptions=True)
+    if _agent is not None:
+        await _agent.aclose()
 
-agent = AIAgent()
+
+app = FastAPI(title="Soda AI API", version="1.0.0", lifespan=lifespan)
+
+services.on_stock_change(_invalidate_agent_stock_cache)
+
+observability.instrument_db()
 
 app.add_middleware(
     CORSMiddleware,
@@ -22,178 +98,204 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "ETag"],
 )
 
-def get_session():
-    with Session(engine) as session:
-        yield session
-
-@app.on_event("startup")
-async def startup_event():
+@app.middleware("http")
+async def request_context(request: Request, call_next):
     """
-    Event handler that runs when the application starts up.
-    It creates database tables and initializes some default product data.
+    Gives every request an id (the caller's X-Request-ID or a new one) that is stamped on
+    all flow log events and echoed back, and records its latency per route.
     """
-    create_db_and_tables()
-    
-    # Initialize default products if they don't exist
-    initial_products = [
-        {"name": "coke", "stock": 200, "price": 5},
-        {"name": "fanta", "stock": 100, "price": 5},
-        {"name": "pepsi", "stock": 60, "price": 5},
-    ]
+    request_id = request.headers.get("x-request-id") or uuid.uuid4().hex
+    token = observability.current_request_id.set(request_id)
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        observability.current_request_id.reset(token)
+        route = request.scope.get("route")
+        observability.HTTP_SECONDS.observe(
+            time.perf_counter() - started,
+            method=request.method,
+            route=route.path if route is not None else "unmatched",
+            status=status,
+        )
+    response.headers["X-Request-ID"] = request_id
+    return response
 
-    with Session(engine) as session:
-        for product_data in initial_products:
-            product_name_lower = product_data["name"].lower()
-            existing_product = session.exec(select(Product).where(Product.name == product_name_lower)).first()
-
-            if existing_product:
-                # If product exists, update its stock and price
-                existing_product.stock = product_data["stock"]
-                existing_product.price = product_data["price"]
-                session.add(existing_product)
-                print(f"Updated existing product: {existing_product.name} with stock {existing_product.stock}")
-            else:
-                # If product does not exist, create a new one
-                new_product = Product(
-                    name=product_name_lower,
-                    stock=product_data["stock"],
-                    price=product_data["price"]
-                )
-                session.add(new_product)
-                print(f"Added new product: {new_product.name} with stock {new_product.stock}")
-        session.commit()
-        print("Initial product data loaded successfully.")
+@app.exception_handler(services.ServiceError)
+async def service_error_handler(request: Request, exc: services.ServiceError):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
 
+def get_session():
+    with Session(engine) as session:
+        yield session
 
+def get_read_session():
+    """Session for read-only endpoints; served by the read replica when one is configured."""
+    with Session(read_engine) as session:
+        yield session
 
 @app.post("/ask")
-def ask(message_input: MessageInput):
+async def ask(message_input: MessageInput):
     try:
-        response = agent.handle_message(message_input.message)
-        return {"response": response}
+        budget = RequestBudget()
+        agent = await agent_ready()
+        response = await agent.handle_message(message_input.message, budget, message_input.session_id)
+        return {"response": response, "usage": budget.report()}
+    except LLMOverloaded as e:
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
     except Exception as e:
         print(e)
         raise HTTPException(status_code=500, detail="Sorry, i cant answer your question right now, please try again")
 
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_stream(message_input: MessageInput):
+    """
+    Server-sent events version of /ask: "start" right away, "intent" once the request is
+    understood, then the answer as a single "result" or as "delta" text chunks, and
+    "done" with the full response and usage.
+    """
+    async def events():
+        try:
+            agent = await agent_ready()
+            async for event, data in agent.stream_message(
+                message_input.message, RequestBudget(), message_input.session_id
+            ):
+                yield sse_event(event, data)
+        except LLMOverloaded as e:
+            yield sse_event("error", {"detail": str(e), "status": 503})
+        except Exception as e:
+            print(e)
+            yield sse_event("error", {"detail": "Sorry, i cant answer your question right now, please try again"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/agent/stats/")
+def agent_stats():
+    return _agent_stats()
+
+@app.get("/agent/sessions/{session_id}")
+def agent_session(session_id: str):
+    state = get_agent().sessions.get(session_id)
+    if state is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"session_id": session_id, "bytes": state.size_bytes(), "summary": state.summary(), "state": state}
+
+@app.get("/metrics")
+def metrics():
+    """Prometheus text format: request, agent stage, LLM and DB latency plus the agent counters."""
+    return Response(observability.render_metrics(_agent_stats()), media_type="text/plain; version=0.0.4")
+
 @app.post("/products/", response_model=ProductOut)
 def create_product(product: ProductCreate, session: Session = Depends(get_session)):
-    product_name_lower = product.name.lower()
-    existing_product = session.exec(select(Product).where(Product.name == product_name_lower)).first()
-    if existing_product:
-        existing_product.stock += product.stock
-        existing_product.price = product.price
-        session.add(existing_product)
-        session.commit()
-        session.refresh(existing_product)
-        return existing_product
-    else:
-        db_product = Product.from_orm(product)
-        db_product.name = product_name_lower
-        session.add(db_product)
-        session.commit()
-        session.refresh(db_product)
-        return db_product
-
-@app.get("/products/", response_model=List[ProductOut])
-def read_products(skip: int = 0, limit: int = 100, session: Session = Depends(get_session)):
-    products = session.exec(select(Product).offset(skip).limit(limit)).all()
-    return products
+    return services.create_product(session, product)
+
+@app.get("/products/", response_model=List[ProductOut], responses={304: {"description": "Not modified"}})
+def read_products(request: Request, response: Response, skip: int = 0, limit: int = 100):
+    """
+    Served from the in-memory catalog. Send the ETag back in If-None-Match to get an
+    empty 304 while nothing has changed.
+    """
+    etag = catalog.etag(skip, limit)
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match", "")
+    if etag in [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")] or if_none_match.strip() == "*":
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return catalog.products(skip, limit)
 
 @app.get("/products/{product_id}", response_model=ProductOut)
-def read_product(product_id: int, session: Session = Depends(get_session)):
-    product = session.get(Product, product_id)
+def read_product(product_id: int):
+    product = catalog.get(product_id)
     if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
+        raise services.NotFoundError("Product not found")
     return product
 
 @app.put("/products/{product_id}", response_model=ProductOut)
 def update_product(product_id: int, product: ProductCreate, session: Session = Depends(get_session)):
-    db_product = session.get(Product, product_id)
-    if db_product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    product_data = product.dict(exclude_unset=True)
-    for key, value in product_data.items():
-        setattr(db_product, key, value)
-    
-    session.add(db_product)
-    session.commit()
-    session.refresh(db_product)
-    return db_product
+    return services.update_product(session, product_id, product)
 
 @app.delete("/products/{product_id}")
 def delete_product(product_id: int, session: Session = Depends(get_session)):
-    product = session.get(Product, product_id)
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    
-    session.delete(product)
-    session.commit()
+    services.delete_product(session, product_id)
     return {"message": "Product deleted successfully"}
 
 
 @app.post("/sales/", response_model=List[SaleOut])
 def create_sale(sale: SaleCreate, session: Session = Depends(get_session)):
-    product = session.exec(select(Product).where(Product.name == sale.product_name)).first()
-    if product is None:
-        raise HTTPException(status_code=404, detail="Product not found")
-    if sale.quantity <= 0:
-        raise HTTPException(status_code=400, detail="Quantity must be greater than zero")
-    if product.stock < sale.quantity:
-        raise HTTPException(status_code=400, detail="Not enough stock to fulfill the sale")
-    sales = []
-    for _ in range(sale.quantity):
-        db_sale = Sale(product_id=product.id)
-        session.add(db_sale)
-        sales.append(db_sale)
-    product.stock -= sale.quantity
-    session.commit()
-    for db_sale in sales:
-        session.refresh(db_sale)
-    return [
-        SaleOut(id=db_sale.id, product_name=product.name, timestamp=db_sale.timestamp)
-        for db_sale in sales
-    ]
+    return services.create_sale(session, sale)
+
+@app.post("/sales/bulk/", response_model=SaleBatchOut, responses={400: {"model": SaleBatchOut}})
+def create_bulk_sale(order: SaleBulkCreate, session: Session = Depends(get_session)):
+    """
+    Places a multi-line order in one transaction: either every line is sold or none is.
+    The result of each line is reported either way; a failed order answers with 400.
+    """
+    result = services.place_order(session, order.items)
+    if not result.success:
+        return JSONResponse(status_code=400, content=result.model_dump(mode="json"))
+    return result
 
 @app.get("/sales/", response_model=List[SaleOut])
-def read_sales(skip: int = 0, limit: int = 100, session: Session = Depends(get_session)):
-    sales = session.exec(select(Sale).offset(skip).limit(limit)).all()
-    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
-    return [
-        SaleOut(id=sale.id, product_name=product_map.get(sale.product_id, "Unknown"), timestamp=sale.timestamp)
-        for sale in sales
-    ]
+def read_sales(skip: int = 0, limit: int = 100, session: Session = Depends(get_read_session)):
+    return services.list_sales(session, skip, limit)
 
 @app.delete("/sales/{sale_id}")
 def delete_sale(sale_id: int, session: Session = Depends(get_session)):
-    sale = session.get(Sale, sale_id)
-    if sale is None:
-        raise HTTPException(status_code=404, detail="Sale not found")  
-    product = session.get(Product, sale.product_id)
-    if product:
-        product.stock += 1
-    session.delete(sale)
-    session.commit()
+    services.delete_sale(session, sale_id)
     return {"message": "Sale deleted successfully"}
 
 @app.get("/sales/history/", response_model=List[SaleOut])
-def sale_history(session: Session = Depends(get_session)):
-    sales = session.exec(select(Sale)).all()
-    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
-    return [
-        SaleOut(id=sale.id, product_name=product_map.get(sale.product_id, "Unknown"), timestamp=sale.timestamp)
-        for sale in sales
-    ]
+def sale_history(
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session: Session = Depends(get_read_session),
+):
+    return services.sale_history(session, start, end)
+
+@app.get("/sales/history/page/", response_model=SalePage)
+def sale_history_page(
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session: Session = Depends(get_read_session),
+):
+    """
+    Keyset pagination over (timestamp, id). Pass the returned next_cursor back to get
+    the following page; it is None on the last page.
+    """
+    return services.sale_history_page(session, limit, cursor, start, end)
+
+@app.get("/sales/history/export/")
+def export_sale_history(
+    export_format: Literal["ndjson", "csv"] = Query("ndjson", alias="format"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+):
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(
+        services.export_sale_rows(services.sale_rows_query(start, end), export_format),
+        media_type=media_type,
+        headers={"Content-Disposition": f"attachment; filename=sales.{export_format}"},
+    )
+
 @app.get("/sales/most_sold/", response_model=List[MostSoldItem])
-def most_sold_items(session: Session = Depends(get_session)):
-    from collections import Counter
-    sales = session.exec(select(Sale)).all()
-    product_map = {p.id: p.name for p in session.exec(select(Product)).all()}
-    counter = Counter(sale.product_id for sale in sales)
-    most_sold = [
-        MostSoldItem(product_name=product_map.get(pid, "Unknown"), total_sold=count)
-        for pid, count in counter.most_common()
-    ]
-    return most_sold
\ No newline at end of file
+def most_sold_items(session: Session = Depends(get_read_session)):
+    return services.most_sold(session)
+
+@app.get("/sales/most_sold/check/", response_model=SalesAggregateCheck)
+def most_sold_consistency_check(session: Session = Depends(get_session)):
+    """Verifies the per-product sales aggregate against the raw sale table."""
+    return check_sales_aggregate(session)
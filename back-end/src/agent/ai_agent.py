@@ -1,78 +1,468 @@
+import asyncio
 import os
-from typing import List
+import time
+from contextlib import asynccontextmanager, contextmanager
+from contextvars import ContextVar
+from typing import AsyncIterator, List, Optional, Tuple
 from dotenv import load_dotenv
+import anyio
 import instructor
-from openai import OpenAI
-from pydantic import BaseModel
-from src.models import Product, engine
-from sqlmodel import Session, select
+from openai import AsyncOpenAI
+from pydantic import BaseModel, ValidationError
 from src.agent.models import UserIntent, FreeChat, QualityCheck
 from src.agent.utils.agent_flow_logging import FlowLogger
-import httpx
+from src.agent.utils.cache import TTLCache, normalize_message
+from src.agent.intent_parser import parse_intent
+from src.agent.utils.budget import BudgetExhausted, RequestBudget, current_budget
+from src.agent.utils.latency import LatencyStats
+from src.agent.utils.admission import AdmissionControl, LLMOverloaded, SingleFlight, TokenBucket
+from src.agent.backend import BackendError, create_backend
+from src.agent.session_store import SessionState, create_session_store
+from src.models import SaleCreate
+from src.observability import LLM_RETRIES, LLM_SECONDS, LLM_TOKENS, SESSION_BYTES, span
 
 logger = FlowLogger()
 load_dotenv()
 
+# attributes of the LLM call in progress, filled in by the instructor hooks
+_current_call: ContextVar[dict] = ContextVar("current_llm_call", default=None)
+
 
 class LLM:
     def __init__(self):
-        # llm_base_url = os.environ.get("LLM_BASE_URL", None)
+        # any OpenAI-compatible server, e.g. bench/fake_llm.py for offline benchmarks
+        llm_base_url = os.environ.get("LLM_BASE_URL") or None
         llm_api_key = os.environ.get("OPENAI_API_KEY")
         self.llm_model = os.environ.get("LLM_MODEL")
+        self.max_retries = int(os.environ.get("LLM_MAX_RETRIES", 2))
+        self.timeout = float(os.environ.get("LLM_TIMEOUT", 60))
         self.client = instructor.from_openai(
-            OpenAI(
-                # base_url=llm_base_url,
+            # retries are instructor's alone, so every HTTP attempt is counted and bounded
+            AsyncOpenAI(
+                base_url=llm_base_url,
                 api_key=f"{llm_api_key}",
+                max_retries=0,
             ),
             mode=instructor.Mode.JSON,
         )
+        # instructor fires these once per attempt, so retries are charged to the budget too
+        self.client.on("completion:kwargs", self._count_call)
+        self.client.on("completion:response", self._count_tokens)
+        self.single_flight = SingleFlight()
+        self.admission = AdmissionControl(
+            max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 16)),
+            max_queue=int(os.environ.get("LLM_MAX_QUEUE", 64)),
+            queue_timeout=float(os.environ.get("LLM_QUEUE_TIMEOUT", 10)),
+        )
+        rate = float(os.environ.get("LLM_RATE_LIMIT", 0))
+        burst = float(os.environ.get("LLM_RATE_BURST", 0)) or None
+        self.rate_limiter = TokenBucket(rate, burst) if rate > 0 else None
+
+    def stats(self) -> dict:
+        return {
+            "admission": self.admission.stats(),
+            "single_flight": self.single_flight.stats(),
+            "rate_limit": self.rate_limiter.stats() if self.rate_limiter is not None else {},
+        }
+
+    def _count_call(self, *args, **kwargs):
+        budget = current_budget.get()
+        if budget is not None:
+            budget.record_call()
+        call = _current_call.get()
+        if call is not None:
+            call["attempts"] += 1
+
+    def _count_tokens(self, response, *args, **kwargs):
+        budget = current_budget.get()
+        usage = getattr(response, "usage", None)
+        if budget is not None and usage is not None:
+            budget.record_tokens(usage.total_tokens or 0)
+        call = _current_call.get()
+        if call is not None and usage is not None:
+            call["tokens"] += usage.total_tokens or 0
+
+    @contextmanager
+    def _traced(self, response_model: BaseModel, streaming: bool = False):
+        """An "llm" span plus the llm_* metrics for one send or stream call."""
+        model, name = f"{self.llm_model}", response_model.__name__
+        with span("llm", model=model, response_model=name, stream=streaming) as call:
+            call.update(attempts=0, tokens=0)
+            token = _current_call.set(call)
+            started = time.perf_counter()
+            outcome = "ok"
+            try:
+                yield call
+            except BaseException:
+                outcome = "error"
+                raise
+            finally:
+                _current_call.reset(token)
+                call["retries"] = max(call["attempts"] - 1, 0)
+                LLM_SECONDS.observe(time.perf_counter() - started, model=model, response_model=name, outcome=outcome)
+                LLM_TOKENS.inc(call["tokens"], model=model)
+                LLM_RETRIES.inc(call["retries"], model=model)
 
-    def send(self, response_model: BaseModel, message: str, context: str = None):
+    def _limits(self):
+        timeout, max_retries = self.timeout, self.max_retries
+        budget = current_budget.get()
+        if budget is not None:
+            budget.check()
+            timeout = min(timeout, budget.remaining_time())
+            max_retries = min(max_retries, budget.calls_left() - 1)
+        return timeout, max_retries
 
+    def _deadline(self) -> Optional[float]:
+        """Seconds left for the whole call, every attempt included; None without a budget."""
+        budget = current_budget.get()
+        return budget.remaining_time() if budget is not None else None
+
+    def _failed(self, e: Exception) -> Exception:
+        budget = current_budget.get()
+        if budget is not None and budget.remaining_time() <= 0:
+            budget.exhausted_reason = "deadline"
+            return BudgetExhausted("deadline")
+        return Exception(f"Failed to parse user command: {str(e)}")
+
+    @asynccontextmanager
+    async def _admitted(self):
+        """A concurrency slot plus a rate limit token; LLMOverloaded when neither comes in time."""
+        timeout, _ = self._limits()
+        async with self.admission.slot(timeout):
+            if self.rate_limiter is not None:
+                await self.rate_limiter.acquire()
+            yield
+
+    async def send(self, response_model: BaseModel, message: str, context: str = None):
+        """
+        Identical calls already in flight (same model, message and context) are shared.
+        Every caller waits for the shared call only as long as its own budget allows; the
+        caller that started it is charged for the attempts and tokens it used.
+        """
+        self._limits()
+        key = (self.llm_model, response_model.__name__, message, context)
+        usage = {}  # gets the shared call's counters only when this caller is the one starting it
         try:
-            command = self.client.chat.completions.create(
-                model=f"{self.llm_model}",
-                messages=[{"role": "user", "content": message}],
-                response_model=response_model,
-                max_retries=5,
-                timeout=60.0,
-                context={"context":context},
+            return await self.single_flight.run(
+                key, lambda: self._send(usage, response_model, message, context), self._deadline()
             )
-            return command
+        except (BudgetExhausted, LLMOverloaded):
+            raise
+        except Exception as e:
+            raise self._failed(e) from e
+        finally:
+            budget = current_budget.get()
+            if budget is not None and usage:
+                for _ in range(usage["call"]["attempts"]):
+                    budget.record_call()
+                budget.record_tokens(usage["call"]["tokens"])
+
+    async def _send(self, usage: dict, response_model: BaseModel, message: str, context: str = None):
+        # the shared call belongs to no single request: it runs with the default timeout
+        # and retries, so one caller's deadline or call cap never fails the others
+        current_budget.set(None)
+        async with self._admitted():
+            with self._traced(response_model) as call:
+                # live counters, so a starter that stops waiting still pays for the attempts made
+                usage.update(call=call)
+                return await self.client.chat.completions.create(
+                    model=f"{self.llm_model}",
+                    messages=[{"role": "user", "content": message}],
+                    response_model=response_model,
+                    max_retries=self.max_retries,
+                    timeout=self.timeout,
+                    context={"context":context},
+                )
+
+    async def stream(self, response_model: BaseModel, message: str, context: str = None):
+        """Like send, but yields the partially filled response_model as tokens arrive."""
+        try:
+            async with self._admitted():
+                timeout, max_retries = self._limits()
+                with self._traced(response_model, streaming=True):
+                    partials = self.client.chat.completions.create_partial(
+                        model=f"{self.llm_model}",
+                        messages=[{"role": "user", "content": message}],
+                        response_model=response_model,
+                        max_retries=max_retries,
+                        timeout=timeout,
+                        context={"context":context},
+                    )
+                    try:
+                        while True:
+                            # each chunk may only take what is left of the request's deadline
+                            try:
+                                partial = await asyncio.wait_for(anext(partials), self._deadline())
+                            except StopAsyncIteration:
+                                break
+                            yield partial
+                    finally:
+                        await partials.aclose()
+        except (BudgetExhausted, LLMOverloaded):
+            raise
         except Exception as e:
-            raise Exception(f"Failed to parse user command: {str(e)}")
+            raise self._failed(e) from e
 
 
 class AIAgent:
-    def __init__(self):
+    STOCK_INFO_KEY = "stock"
+    STOCK_INFO_CONTEXT = "You are a working with Drink Sales Return the Stock Information Bellow in a user Friendly way"
+    DEGRADED_ANSWER = "Sorry, I'm taking too long to answer right now, please try again in a moment"
+    NOT_UNDERSTOOD_ANSWER = "Sorry, I did not understand your question"
+    CHAT_FAILED_ANSWER = "Sorry, i cant answer your question right now, try again later"
+
+    def __init__(self, backend=None):
         self.llm = LLM()
+        self.backend = backend or create_backend()
+        self.intent_cache = TTLCache(
+            max_size=int(os.environ.get("INTENT_CACHE_SIZE", 1024)),
+            ttl=float(os.environ.get("INTENT_CACHE_TTL", 3600)),
+        )
+        self.info_cache = TTLCache(
+            max_size=1,
+            ttl=float(os.environ.get("INFO_CACHE_TTL", 300)),
+        )
+        self.fast_path_min_confidence = float(os.environ.get("FAST_PATH_MIN_CONFIDENCE", 0.85))
+        self.fast_path_attempts = 0
+        self.fast_path_hits = 0
+        self._product_names = None
+        self.max_attempts = int(os.environ.get("AGENT_MAX_ATTEMPTS", 3))
+        self.verifier = os.environ.get("INTENT_VERIFIER", "local")
+        self.verify_latency = {"local": LatencyStats(), "llm": LatencyStats()}
+        self.sessions = create_session_store()
+        self.session_max_turns = int(os.environ.get("SESSION_MAX_TURNS", 3))
+        self.session_turn_chars = int(os.environ.get("SESSION_TURN_CHARS", 200))
+
+    def invalidate_stock_cache(self):
+        """Called whenever stock, prices or products change so info answers are never stale."""
+        self.info_cache.invalidate()
+        self._product_names = None
+
+    async def product_names(self) -> List[str]:
+        version = await self.backend.catalog_version()
+        cached = self._product_names
+        if cached is None or cached[0] != version:
+            cached = (version, [product.name for product in await self.backend.list_products()])
+            self._product_names = cached
+        return cached[1]
+
+    async def stock_info_key(self):
+        """
+        The info answer is cached per catalog version, so a sale on any worker makes the
+        next stock question go back to the model instead of getting a stale answer.
+        """
+        return self.STOCK_INFO_KEY, await self.backend.catalog_version()
+
+    async def aclose(self):
+        await self.backend.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "intent_cache": self.intent_cache.stats(),
+            "info_cache": self.info_cache.stats(),
+            "fast_path": {
+                "attempts": self.fast_path_attempts,
+                "hits": self.fast_path_hits,
+                "hit_rate": self.fast_path_hits / self.fast_path_attempts if self.fast_path_attempts else 0.0,
+                "min_confidence": self.fast_path_min_confidence,
+            },
+            "llm": self.llm.stats(),
+            "intent_verifier": {
+                "mode": self.verifier,
+                **{mode: latency.stats() for mode, latency in self.verify_latency.items()},
+            },
+            "sessions": self.sessions.stats(),
+        }
+
+    async def _session_call(self, fn, *args):
+        # the SQLite store does file I/O, which must not hold up the event loop
+        if self.sessions.blocking:
+            return await anyio.to_thread.run_sync(fn, *args)
+        return fn(*args)
+
+    async def load_session(self, session_id: Optional[str]) -> Optional[SessionState]:
+        if session_id is None:
+            return None
+        return await self._session_call(self.sessions.get, session_id) or SessionState()
+
+    async def save_session(
+        self, session_id: Optional[str], session: Optional[SessionState], message: str, answer: str
+    ):
+        if session is None:
+            return
+        session.add_turn(message, answer, self.session_max_turns, self.session_turn_chars)
+        await self._session_call(self.sessions.save, session_id, session)
+        SESSION_BYTES.observe(session.size_bytes())
+
+    @staticmethod
+    def with_session_context(session: Optional[SessionState], message: str) -> str:
+        """`message` prefixed with the session summary, if there is one to add."""
+        context = session.summary() if session is not None else None
+        return message if context is None else f"{context}\nCurrent message: {message}"
+
+    async def fast_path_intent(self, message: str) -> Optional[UserIntent]:
+        """Rule-based intent for simple orders and stock questions, None when the LLM is needed."""
+        self.fast_path_attempts += 1
+        intent, confidence = parse_intent(message, await self.product_names())
+        if intent is None or confidence < self.fast_path_min_confidence:
+            return None
+        self.fast_path_hits += 1
+        logger.info("Fast Path Intent", {"confidence": round(confidence, 2), "intent": intent.model_dump()})
+        return intent
 
-    def handle_message(
-        self, message: str, attempts: int = 0, max_attempts: int = 10
+    async def handle_message(
+        self, message: str, budget: Optional[RequestBudget] = None, session_id: Optional[str] = None
     ) -> str:
-        if attempts == 0:
-            logger.success("Starting Agent Flow Execution", message)
+        """
+        Runs one request under `budget` (a fresh default one when omitted). Classification
+        is retried at most max_attempts times and stops early when the model keeps returning
+        an intent that was already rejected; once the budget runs out a degraded answer is
+        returned instead of waiting on more model calls. With a `session_id` the message is
+        read in the light of that conversation's last order and recent turns.
+        """
+        budget = budget or RequestBudget()
+        token = current_budget.set(budget)
+        session = await self.load_session(session_id)
+        try:
+            with span("ask"):
+                answer = await self._run_flow(message, budget, session)
+        except BudgetExhausted:
+            logger.warn("Request Budget Exhausted", budget.report())
+            answer = self.DEGRADED_ANSWER
+        finally:
+            current_budget.reset(token)
+        await self.save_session(session_id, session, message, answer)
+        return answer
+
+    async def stream_message(
+        self, message: str, budget: Optional[RequestBudget] = None, session_id: Optional[str] = None
+    ) -> AsyncIterator[Tuple[str, dict]]:
+        """
+        handle_message as a series of (event, data) pairs for server-sent events: "start"
+        straight away, "intent" once the request is understood, then the answer either as
+        one "result" (orders, most sold, failures) or as "delta" chunks while the model
+        writes it (stock info, chat), and finally "done" carrying the whole answer.
+        """
+        budget = budget or RequestBudget()
+        token = current_budget.set(budget)
+        session = await self.load_session(session_id)
+        try:
+            with span("ask", stream=True):
+                yield "start", {}
+                logger.success("Starting Agent Flow Execution", message)
+                intent = await self.resolve_intent(message, budget, session)
+                if intent is None:
+                    answer = self.NOT_UNDERSTOOD_ANSWER
+                    yield "result", {"text": answer}
+                elif intent.action in ("info", "chat", "misc"):
+                    yield "intent", {"action": intent.action}
+                    parts = []
+                    with span(f"flow.{intent.action}", stream=True):
+                        async for delta in self.stream_answer(intent, message, session):
+                            parts.append(delta)
+                            yield "delta", {"text": delta}
+                    answer = "".join(parts)
+                else:
+                    yield "intent", {"action": intent.action}
+                    answer = await self.flow_continue(intent, message, session)
+                    yield "result", {"text": answer}
+        except BudgetExhausted:
+            logger.warn("Request Budget Exhausted", budget.report())
+            answer = self.DEGRADED_ANSWER
+            yield "result", {"text": answer}
+        finally:
+            current_budget.reset(token)
+        await self.save_session(session_id, session, message, answer)
+        yield "done", {"response": answer, "usage": budget.report()}
 
-        if attempts >= max_attempts:
-            logger.error("Failed to Execute Flow With:", message)
-            return "Sorry, I did not understand your question"
+    async def _run_flow(self, message: str, budget: RequestBudget, session: Optional[SessionState] = None) -> str:
+        logger.success("Starting Agent Flow Execution", message)
+        intent = await self.resolve_intent(message, budget, session)
+        if intent is None:
+            return self.NOT_UNDERSTOOD_ANSWER
+        return await self.flow_continue(intent, message, session)
 
-        intent = self.identify_intent(message)
-        logger.info("Analysing Intent", intent)
+    async def resolve_intent(
+        self, message: str, budget: RequestBudget, session: Optional[SessionState] = None
+    ) -> Optional[UserIntent]:
+        """
+        Intent cache, then the rule-based fast path, then the LLM; None when nothing fits.
+        Once a session has history the cache is skipped both ways, since the same words
+        ("make that three") mean something different in each conversation.
+        """
+        prompt = self.with_session_context(session, message)
+        cacheable = prompt == message
+        cache_key = normalize_message(message)
+        cached_intent = self.intent_cache.get(cache_key) if cacheable else None
+        if cached_intent is not None:
+            logger.info("Intent Cache Hit", cached_intent)
+            return cached_intent
+        with span("fast_path") as fast_path:
+            fast_intent = await self.fast_path_intent(message)
+            fast_path["hit"] = fast_intent is not None
+        if fast_intent is not None:
+            return fast_intent
 
-        response_ok = self.intent_verify(intent, message)
-        if not response_ok:
-            return self.handle_message(message, attempts + 1, max_attempts)
-        else:
-            return self.flow_continue(intent, message)
+        rejected = []
+        for _ in range(self.max_attempts):
+            intent = await self.identify_intent(prompt)
+            logger.info("Analysing Intent", intent)
 
-    def identify_intent(self, message: str) -> UserIntent:
-        response = self.llm.send(UserIntent, message)
+            with span("intent_verify", mode=self.verifier) as verify:
+                verified = await self.intent_verify(intent, message)
+                verify["valid"] = verified is not None
+            if verified is not None:
+                if cacheable:
+                    self.intent_cache.set(cache_key, verified)
+                return verified
+            if intent in rejected:
+                logger.warn("Model Repeated a Rejected Intent", "Stopping early")
+                break
+            rejected.append(intent)
+
+        logger.error("Failed to Execute Flow With:", {"message": message, "usage": budget.report()})
+        return None
+
+    async def identify_intent(self, message: str) -> UserIntent:
+        with span("identify_intent"):
+            response = await self.llm.send(UserIntent, message)
         if response.orders and response.message is None:
-            response = self.llm.send(UserIntent, message)
+            with span("identify_intent_repeat"):
+                response = await self.llm.send(UserIntent, message)
         return response
 
-    def intent_verify(self, intent: BaseModel, message: str):
+    async def intent_verify(self, intent: UserIntent, message: str) -> Optional[UserIntent]:
+        """
+        Returns `intent` with order names in catalog spelling when it has the shape its
+        action needs, None when it should be asked for again. INTENT_VERIFIER chooses how:
+        "local" (default) runs the UserIntent validators only, "llm" asks the QualityCheck
+        model, "hybrid" validates locally and asks the model only when an order names a
+        product the catalog does not know.
+        """
+        if self.verifier == "llm":
+            with self.verify_latency["llm"].time():
+                return intent if await self.llm_verify(intent, message) else None
+
+        product_names = await self.product_names()
+        with self.verify_latency["local"].time():
+            verified = self.local_verify(intent, product_names)
+        if verified is None or self.verifier != "hybrid" or verified.action != "buy":
+            return verified
+        if all(order.soda_name in product_names for order in verified.orders):
+            return verified
+        with self.verify_latency["llm"].time():
+            return verified if await self.llm_verify(verified, message) else None
+
+    def local_verify(self, intent: UserIntent, product_names: List[str]) -> Optional[UserIntent]:
+        try:
+            verified = UserIntent.model_validate(intent.model_dump(), context={"product_names": product_names})
+        except ValidationError as e:
+            logger.warn("Intent Not Indentified", e.errors()[0]["msg"])
+            return None
+        logger.success("Intent Validated Locally")
+        return verified
+
+    async def llm_verify(self, intent: UserIntent, message: str) -> bool:
         qa_context = """ 
             You are a validation agent responsible for checking if a user intent action and its corresponding JSON payload are semantically valid.
             Given:
@@ -108,7 +498,7 @@ class AIAgent:
             logger.warn("Intent Not Indentified", "Trying Again")
             return False
 
-        response = self.llm.send(QualityCheck, verify, context=qa_context)
+        response = await self.llm.send(QualityCheck, verify, context=qa_context)
         if response.valid == False:
             logger.warn("Intent Not Indentified", "Trying Again")
         if response.valid:
@@ -116,53 +506,50 @@ class AIAgent:
 
         return response.valid
 
-    def flow_continue(self, command: UserIntent, message: str):
-        backend_base_url = os.environ.get("BACKEND_BASE_URL", "http://localhost:8000")
+    async def flow_continue(self, command: UserIntent, message: str, session: Optional[SessionState] = None):
+        with span(f"flow.{command.action}"):
+            return await self._flow_continue(command, message, session)
+
+    async def _flow_continue(self, command: UserIntent, message: str, session: Optional[SessionState] = None):
         if command.action == "buy":
-            sales_results = []
-            for order in command.orders:
-                payload = {
-                    "product_name": order.soda_name.lower(),
-                    "quantity": order.quantity
-                }
-                try:
-                    response = httpx.post(f"{backend_base_url}/sales/", json=payload)
-                    if response.status_code == 200:
-                        sales = response.json()
-                        sales_results.append(f"Ordered {order.quantity}x {order.soda_name}: Success")
-                    else:
-                        sales_results.append(f"Ordered {order.quantity}x {order.soda_name}: Failed ({response.json().get('detail', 'Unknown error')})")
-                except Exception as e:
-                    sales_results.append(f"Ordered {order.quantity}x {order.soda_name}: Failed ({str(e)})")
+            lines = [SaleCreate(product_name=order.soda_name.lower(), quantity=order.quantity) for order in command.orders]
+            try:
+                with span("backend.place_order"):
+                    result = await self.backend.place_order(lines)
+                sales_results = [
+                    f"Ordered {order.quantity}x {order.soda_name}: Success" if line.success
+                    else f"Ordered {order.quantity}x {order.soda_name}: Failed ({line.detail})"
+                    for order, line in zip(command.orders, result.lines)
+                ]
+                placed = all(line.success for line in result.lines)
+            except Exception as e:
+                detail = e.detail if isinstance(e, BackendError) else str(e)
+                sales_results = [f"Ordered {order.quantity}x {order.soda_name}: Failed ({detail})" for order in command.orders]
+                placed = False
+            if session is not None:
+                session.remember_order(command.orders, placed)
             final_response = " \n ".join(sales_results)
             logger.info("Buying", command.orders)
             logger.success("Flow Completed", {"input": message, "response": final_response})
             return final_response
 
         elif command.action == "info":
-            info_context = "You are a working with Drink Sales Return the Stock Information Bellow in a user Friendly way"
-            try:
-                resp = httpx.get(f"{backend_base_url}/products/?skip=0&limit=100")
-                resp.raise_for_status()
-                products = resp.json()
-            except Exception as e:
-                logger.error("Failed to fetch products", str(e))
-                return "Sorry, I couldn't retrieve product information right now."
-
-            if not products:
-                return "No products available."
-            stock = "Stock available:\n" + "\n".join(
-                f"{p['name'].title()}: {p['stock']} in stock, ${p['price']} \n" for p in products
-            )
-            response = self.llm.send(FreeChat, message=stock, context=info_context)
+            info_key = await self.stock_info_key()
+            cached_answer = self.info_cache.get(info_key)
+            if cached_answer is not None:
+                return cached_answer
+            stock, failure = await self._stock_prompt()
+            if stock is None:
+                return failure
+            response = await self.llm.send(FreeChat, message=stock, context=self.STOCK_INFO_CONTEXT)
+            self.info_cache.set(info_key, response.message)
 
             return response.message
         
         elif command.action == "most_sold":
             try:
-                resp = httpx.get(f"{backend_base_url}/sales/most_sold/")
-                resp.raise_for_status()
-                most_sold = resp.json()
+                with span("backend.most_sold"):
+                    most_sold = await self.backend.most_sold()
             except Exception as e:
                 logger.error("Failed to fetch most sold products", str(e))
                 return "Sorry, I couldn't retrieve most sold product information right now."
@@ -170,22 +557,74 @@ class AIAgent:
             if not most_sold:
                 return "No sales data available."
             result = "Most Sold Products:\n" + "\n".join(
-                f"{item['product_name'].title()}: {item['total_sold']} sold in total" for item in most_sold
+                f"{item.product_name.title()}: {item.total_sold} sold in total" for item in most_sold
             )
             return result
 
         elif command.action in ("chat", "misc"):
             try:
-                response: FreeChat = self.llm.send(FreeChat, command.message)
-            except:
-                response = (
-                    "Sorry, i cant answer your question right now, try again later"
-                )
-                logger.error("Flow Failed", response)
-            finally:
-                logger.success(
-                    "Flow Completed", {"input": message, "response": response.message}
-                )
+                response: FreeChat = await self.llm.send(FreeChat, self.with_session_context(session, command.message))
+            except (BudgetExhausted, LLMOverloaded):
+                raise
+            except Exception:
+                response = FreeChat(message=self.CHAT_FAILED_ANSWER)
+                logger.error("Flow Failed", response.message)
+            logger.success(
+                "Flow Completed", {"input": message, "response": response.message}
+            )
             return response.message
 
         return "Sorry, I couldn't understand your request."
+
+    async def _stock_prompt(self):
+        """The stock listing handed to the model, or (None, answer) when there is nothing to list."""
+        try:
+            with span("backend.list_products"):
+                products = await self.backend.list_products()
+        except Exception as e:
+            logger.error("Failed to fetch products", str(e))
+            return None, "Sorry, I couldn't retrieve product information right now."
+
+        if not products:
+            return None, "No products available."
+        stock = "Stock available:\n" + "\n".join(
+            f"{p.name.title()}: {p.stock} in stock, ${p.price} \n" for p in products
+        )
+        return stock, None
+
+    async def stream_answer(
+        self, command: UserIntent, message: str, session: Optional[SessionState] = None
+    ) -> AsyncIterator[str]:
+        """The text of an info or chat answer, yielded piece by piece as the model writes it."""
+        context = None
+        if command.action == "info":
+            info_key = await self.stock_info_key()
+            cached_answer = self.info_cache.get(info_key)
+            if cached_answer is not None:
+                yield cached_answer
+                return
+            prompt, failure = await self._stock_prompt()
+            if prompt is None:
+                yield failure
+                return
+            context = self.STOCK_INFO_CONTEXT
+        else:
+            prompt = self.with_session_context(session, command.message)
+
+        text = ""
+        try:
+            async for partial in self.llm.stream(FreeChat, prompt, context):
+                current = partial.message or ""
+                if len(current) > len(text) and current.startswith(text):
+                    yield current[len(text):]
+                    text = current
+        except (BudgetExhausted, LLMOverloaded):
+            raise
+        except Exception:
+            logger.error("Flow Failed", self.CHAT_FAILED_ANSWER)
+            if not text:
+                yield self.CHAT_FAILED_ANSWER
+            return
+        if command.action == "info":
+            self.info_cache.set(info_key, text)
+        logger.success("Flow Completed", {"input": message, "response": text})
@@ -0,0 +1,104 @@
+import os
+from typing import List, Optional, Tuple
+
+import anyio
+import httpx
+from sqlmodel import Session
+
+from src.catalog import catalog
+from src.models import MostSoldItem, ProductOut, SaleBatchOut, SaleCreate, engine, read_engine
+from src.services import ServiceError, most_sold, place_order
+
+
+class BackendError(Exception):
+    """A sale or lookup the backend refused, with the detail to show to the user."""
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class LocalBackend:
+    """Calls the service layer in-process, in a worker thread with a session of its own."""
+
+    async def _run(self, fn, *args, bind=engine):
+        def call():
+            with Session(bind) as session:
+                return fn(session, *args)
+
+        try:
+            return await anyio.to_thread.run_sync(call)
+        except ServiceError as e:
+            raise BackendError(e.detail)
+
+    async def place_order(self, lines: List[SaleCreate]) -> SaleBatchOut:
+        return await self._run(place_order, lines)
+
+    async def list_products(self) -> List[ProductOut]:
+        # served from the in-memory catalog; only a (re)load needs a worker thread
+        if catalog.fresh:
+            return catalog.products(0, 100)
+        return await anyio.to_thread.run_sync(catalog.products, 0, 100)
+
+    async def catalog_version(self) -> Optional[Tuple[int, int]]:
+        """Changes whenever any worker changes products or stock, for keying cached answers."""
+        if catalog.fresh:
+            return catalog.version()
+        return await anyio.to_thread.run_sync(catalog.version)
+
+    async def most_sold(self) -> List[MostSoldItem]:
+        return await self._run(most_sold, bind=read_engine)
+
+    async def aclose(self):
+        pass
+
+
+class HttpBackend:
+    """Talks to a backend API running elsewhere, for deployments that split the agent out."""
+
+    def __init__(self, base_url: Optional[str] = None):
+        self.base_url = base_url or os.environ.get("BACKEND_BASE_URL", "http://localhost:8000")
+        self.client: Optional[httpx.AsyncClient] = None
+
+    def http(self) -> httpx.AsyncClient:
+        """Pooled client, created once and reused by every request."""
+        if self.client is None:
+            self.client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=float(os.environ.get("BACKEND_TIMEOUT", 10)),
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=20),
+            )
+        return self.client
+
+    async def place_order(self, lines: List[SaleCreate]) -> SaleBatchOut:
+        response = await self.http().post("/sales/bulk/", json={"items": [line.model_dump() for line in lines]})
+        body = response.json()
+        if "lines" not in body:
+            raise BackendError(body.get("detail", "Unknown error"))
+        return SaleBatchOut(**body)
+
+    async def list_products(self) -> List[ProductOut]:
+        response = await self.http().get("/products/", params={"skip": 0, "limit": 100})
+        response.raise_for_status()
+        return [ProductOut(**p) for p in response.json()]
+
+    async def catalog_version(self) -> Optional[Tuple[int, int]]:
+        # not visible from here: cached stock answers rely on INFO_CACHE_TTL instead
+        return None
+
+    async def most_sold(self) -> List[MostSoldItem]:
+        response = await self.http().get("/sales/most_sold/")
+        response.raise_for_status()
+        return [MostSoldItem(**item) for item in response.json()]
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+
+def create_backend():
+    """AGENT_BACKEND=http makes the agent use BACKEND_BASE_URL instead of the local services."""
+    if os.environ.get("AGENT_BACKEND", "local") == "http":
+        return HttpBackend()
+    return LocalBackend()
@@ -0,0 +1,156 @@
+from difflib import SequenceMatcher
+from typing import Iterable, List, Optional, Tuple
+
+from src.agent.models import SodaOrder, UserIntent
+from src.agent.utils.cache import normalize_message
+
+NUMBER_WORDS = {
+    "zero": 0, "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11,
+    "twelve": 12, "thirteen": 13, "fourteen": 14, "fifteen": 15, "sixteen": 16,
+    "seventeen": 17, "eighteen": 18, "nineteen": 19, "twenty": 20, "thirty": 30,
+    "forty": 40, "fifty": 50, "couple": 2, "pair": 2, "dozen": 12,
+}
+BUY_WORDS = {"buy", "want", "order", "get", "give", "take", "need", "purchase", "grab", "bring"}
+INFO_WORDS = {"stock", "stocks", "available", "availability", "menu", "inventory", "left", "price", "prices", "options", "sell", "drinks", "sodas"}
+MOST_SOLD_PHRASES = ("most sold", "best seller", "best sellers", "best selling", "most popular", "top selling", "sold the most", "sells the most")
+# words that may sit between quantity/product pairs in an order with no buy word ("2 cokes and 1 fanta")
+PAIR_JOINERS = {"and", "plus", "please", "pls", "plz"}
+QUESTION_STARTS = ("what", "which", "do", "does", "is", "are", "how")
+NEGATIONS = {"not", "dont", "don", "no", "never", "cancel", "without", "instead", "but"}
+FILLER_WORDS = {
+    "i", "id", "d", "would", "could", "can", "you", "me", "us", "please", "pls", "plz",
+    "and", "also", "plus", "with", "of", "to", "some", "the", "cans", "bottles", "bottle",
+    "for", "my", "we", "ll", "m", "im", "just", "too", "more", "hi", "hello", "hey",
+    "thanks", "thank", "ok", "okay", "what", "whats", "s", "is", "are", "do", "does",
+    "in", "there", "how", "many", "much", "show", "tell", "list", "your", "currently",
+    "now", "right", "all", "which", "soda", "drink", "any", "got", "go", "let", "lets",
+    "that", "will", "it", "them", "they", "has",
+}
+FUZZY_THRESHOLD = 0.8
+
+
+def _singular_forms(token: str) -> Tuple[str, ...]:
+    forms = (token,)
+    if token.endswith("s") and len(token) > 3:
+        forms += (token[:-1],)
+    if token.endswith("es") and len(token) > 4:
+        forms += (token[:-2],)
+    return forms
+
+
+def match_product(phrase: str, product_names: Iterable[str]) -> Tuple[Optional[str], float]:
+    """Best catalog name for `phrase`, allowing plurals and small misspellings."""
+    best_name, best_score = None, 0.0
+    for name in product_names:
+        for candidate in _singular_forms(phrase):
+            if candidate == name:
+                return name, 1.0
+            score = SequenceMatcher(None, candidate, name).ratio()
+            if score > best_score:
+                best_name, best_score = name, score
+    if best_score >= FUZZY_THRESHOLD:
+        return best_name, best_score
+    return None, 0.0
+
+
+def _number(token: str) -> Optional[int]:
+    if token.isdigit():
+        return int(token)
+    return NUMBER_WORDS.get(token)
+
+
+def parse_intent(message: str, product_names: List[str]) -> Tuple[Optional[UserIntent], float]:
+    """
+    Rule-based parser for the common kiosk phrases: orders such as "buy 3 fanta and 1 pepsi",
+    stock questions and most sold questions.
+    Returns the intent and a confidence between 0 and 1; the intent is None when the
+    message does not look like any of them and the LLM has to classify it.
+    """
+    text = normalize_message(message)
+    tokens = text.split()
+    if not tokens:
+        return None, 0.0
+    if any(token in NEGATIONS for token in tokens):
+        return None, 0.0
+
+    product_names = [name.lower() for name in product_names]
+    longest_name = max((len(name.split()) for name in product_names), default=1)
+
+    if any(phrase in text for phrase in MOST_SOLD_PHRASES):
+        unknown = [t for t in tokens if t not in FILLER_WORDS and _number(t) is None and not match_product(t, product_names)[0]]
+        return UserIntent(action="most_sold"), 0.95 if len(unknown) <= 3 else 0.6
+
+    orders = {}
+    scores = []
+    pending_quantity = None
+    has_buy_word = has_info_word = False
+    # "pepsi" or "coke?" names a product without ordering it; only a message made of
+    # nothing but "<quantity> <product>" pairs counts as an order without a buy word
+    only_pairs = True
+    unknown = 0
+    index = 0
+    while index < len(tokens):
+        token = tokens[index]
+        matched = False
+        could_be_product = token not in FILLER_WORDS and _number(token) is None
+        # multi-word product names first ("dr pepper"), then single tokens
+        for size in range(min(longest_name, len(tokens) - index), 0, -1):
+            if not could_be_product or (size == 1 and len(token) < 3):
+                break
+            phrase = " ".join(tokens[index:index + size])
+            name, score = match_product(phrase, product_names)
+            if name is not None:
+                if pending_quantity is None:
+                    only_pairs = False
+                elif pending_quantity <= 0:
+                    return None, 0.0
+                orders[name] = orders.get(name, 0) + (1 if pending_quantity is None else pending_quantity)
+                scores.append(score)
+                pending_quantity = None
+                index += size
+                matched = True
+                break
+        if matched:
+            continue
+
+        number = _number(token)
+        if number is not None:
+            if pending_quantity and pending_quantity >= 20 and pending_quantity % 10 == 0 and number < 10:
+                pending_quantity += number
+            else:
+                pending_quantity = number
+        elif token in BUY_WORDS:
+            has_buy_word = True
+        elif token in INFO_WORDS:
+            has_info_word = True
+        elif token not in FILLER_WORDS:
+            unknown += 1
+        if number is None and token not in PAIR_JOINERS:
+            only_pairs = False
+        index += 1
+
+    coverage = 1.0 - unknown / len(tokens)
+
+    if orders and not has_info_word:
+        # an order is placed for real, so any word we can't account for ("and some
+        # water", "i have 2 cokes already") goes to the LLM instead of being dropped
+        if unknown or not (has_buy_word or only_pairs):
+            return None, 0.0
+        # questions ("what is coke", "coke?") are left to the LLM rather than sold
+        if "?" in message or tokens[0] in QUESTION_STARTS:
+            return None, 0.0
+        confidence = min(scores)
+        if pending_quantity is not None:
+            # a quantity that was never attached to a product, e.g. "2 cokes and 3"
+            confidence *= 0.5
+        intent = UserIntent(
+            action="buy",
+            orders=[SodaOrder(soda_name=name, quantity=quantity) for name, quantity in orders.items()],
+        )
+        return intent, confidence
+
+    if has_info_word and not orders and pending_quantity is None:
+        return UserIntent(action="info"), coverage
+
+    return None, 0.0
@@ -1,6 +1,6 @@
 from typing import List, Literal, Optional
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, ValidationInfo, model_validator
 
 
 
@@ -23,6 +23,36 @@ class UserIntent(BaseModel):
         description="Freeform user message if the action is 'chat'"
     )
 
+    @model_validator(mode="after")
+    def check_action_shape(self, info: ValidationInfo):
+        """
+        The rules the QualityCheck prompt spells out, enforced when validating with a
+        {"product_names": [...]} context: a buy needs orders with positive quantities,
+        a chat needs a message, info and most_sold take no orders. Order names that
+        match the catalog are rewritten to the catalog spelling; unknown ones are kept
+        so the sale can report them.
+        """
+        product_names = (info.context or {}).get("product_names")
+        if product_names is None:
+            return self
+        if self.action == "buy":
+            if not self.orders:
+                raise ValueError("a buy intent needs at least one order")
+            from src.agent.intent_parser import match_product
+
+            for order in self.orders:
+                if order.quantity <= 0:
+                    raise ValueError(f"quantity for {order.soda_name} must be greater than zero")
+                name, _ = match_product(order.soda_name.strip().lower(), product_names)
+                if name is not None:
+                    order.soda_name = name
+        elif self.action == "chat":
+            if not (self.message or "").strip():
+                raise ValueError("a chat intent needs a message")
+        else:
+            self.orders = None
+        return self
+
 
 class FreeChat(BaseModel):
     message:str
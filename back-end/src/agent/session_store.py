@@ -0,0 +1,200 @@
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import List, Optional
+
+from pydantic import BaseModel
+
+from src.agent.models import SodaOrder
+
+
+class SessionState(BaseModel):
+    """
+    What the agent remembers about a conversation: the last order and a few shortened
+    recent turns, never the whole transcript, so the context it adds to a prompt stays
+    the same size however long the conversation gets.
+    """
+    last_order: Optional[List[SodaOrder]] = None
+    last_order_placed: Optional[bool] = None
+    turns: List[str] = []
+
+    def remember_order(self, orders: List[SodaOrder], placed: bool):
+        self.last_order = [order.model_copy() for order in orders]
+        self.last_order_placed = placed
+
+    def add_turn(self, message: str, answer: str, max_turns: int, max_chars: int):
+        def shorten(text: str) -> str:
+            text = " ".join(text.split())
+            return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+        self.turns = (self.turns + [f"User: {shorten(message)}", f"Assistant: {shorten(answer)}"])[-2 * max_turns:]
+
+    def summary(self) -> Optional[str]:
+        lines = []
+        if self.turns:
+            lines.append("Conversation so far (most recent last):")
+            lines.extend(self.turns)
+        if self.last_order:
+            items = ", ".join(f"{order.quantity}x {order.soda_name}" for order in self.last_order)
+            if self.last_order_placed:
+                lines.append(f"Last order: {items} (placed). A follow-up order only lists what is still to buy.")
+            else:
+                lines.append(f"Last order: {items} (not placed). If the user changes or repeats it, "
+                             "answer with the complete order to place now.")
+        return "\n".join(lines) or None
+
+    def size_bytes(self) -> int:
+        return len(self.model_dump_json())
+
+
+class InMemorySessionStore:
+    """
+    Bounded LRU of session states that also expire `ttl` seconds after their last use.
+    Private to one process, so only right for a single worker.
+    """
+    blocking = False
+
+    def __init__(self, max_sessions: int = 10000, ttl: float = 1800.0):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            updated_at, state = entry
+            if time.monotonic() - updated_at > self.ttl:
+                del self._sessions[session_id]
+                self.expirations += 1
+                return None
+            return state.model_copy(deep=True)
+
+    def save(self, session_id: str, state: SessionState):
+        with self._lock:
+            self._sessions[session_id] = (time.monotonic(), state.model_copy(deep=True))
+            self._sessions.move_to_end(session_id)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        with self._lock:
+            sizes = [state.size_bytes() for _, state in self._sessions.values()]
+        return {
+            "backend": "memory",
+            "sessions": len(sizes),
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "bytes_total": sum(sizes),
+            "bytes_max": max(sizes, default=0),
+            "bytes_avg": sum(sizes) / len(sizes) if sizes else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SqliteSessionStore:
+    """
+    Session states in a SQLite file, so they survive restarts and are shared between
+    workers on one host. Calls block on file I/O, so async code runs them in a thread.
+    Expired rows, and the oldest ones beyond max_sessions, are purged at most every
+    `purge_interval` seconds by whichever save comes along.
+    """
+    blocking = True
+
+    def __init__(
+        self, path: str = "sessions.db", max_sessions: int = 10000, ttl: float = 1800.0, purge_interval: float = 60.0
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA busy_timeout=5000")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS agent_session (id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS ix_agent_session_updated_at ON agent_session (updated_at)")
+        self.evictions = 0
+
+    def get(self, session_id: str) -> Optional[SessionState]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT data FROM agent_session WHERE id = ? AND updated_at >= ?", (session_id, time.time() - self.ttl)
+            ).fetchone()
+        return SessionState.model_validate_json(row[0]) if row else None
+
+    def save(self, session_id: str, state: SessionState):
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                "INSERT INTO agent_session (id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (session_id, state.model_dump_json(), now),
+            )
+            if time.monotonic() - self._purged_at >= self.purge_interval:
+                self._purge(now)
+
+    def _purge(self, now: float):
+        self._purged_at = time.monotonic()
+        self._db.execute("DELETE FROM agent_session WHERE updated_at < ?", (now - self.ttl,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM agent_session").fetchone()
+        if count > self.max_sessions:
+            self.evictions += self._db.execute(
+                "DELETE FROM agent_session WHERE id IN (SELECT id FROM agent_session ORDER BY updated_at LIMIT ?)",
+                (count - self.max_sessions,),
+            ).rowcount
+
+    def delete(self, session_id: str):
+        with self._lock:
+            self._db.execute("DELETE FROM agent_session WHERE id = ?", (session_id,))
+
+    def stats(self) -> dict:
+        with self._lock:
+            count, total, largest = self._db.execute(
+                "SELECT COUNT(*), COALESCE(SUM(LENGTH(data)), 0), COALESCE(MAX(LENGTH(data)), 0) "
+                "FROM agent_session WHERE updated_at >= ?",
+                (time.time() - self.ttl,),
+            ).fetchone()
+        return {
+            "backend": "sqlite",
+            "sessions": count,
+            "max_sessions": self.max_sessions,
+            "ttl": self.ttl,
+            "bytes_total": total,
+            "bytes_max": largest,
+            "bytes_avg": total / count if count else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def create_session_store():
+    """
+    SESSION_STORE=sqlite keeps sessions in SESSION_DB_PATH, =memory in the process. When
+    unset, sqlite is used as soon as WEB_CONCURRENCY asks for more than one worker, since
+    a follow-up can land on any of them.
+    """
+    max_sessions = int(os.environ.get("SESSION_MAX", 10000))
+    ttl = float(os.environ.get("SESSION_TTL", 1800))
+    backend = os.environ.get("SESSION_STORE") or ("sqlite" if int(os.environ.get("WEB_CONCURRENCY") or 1) > 1 else "memory")
+    if backend == "sqlite":
+        return SqliteSessionStore(
+            os.environ.get("SESSION_DB_PATH", "sessions.db"),
+            max_sessions,
+            ttl,
+            float(os.environ.get("SESSION_PURGE_INTERVAL", 60)),
+        )
+    return InMemorySessionStore(max_sessions, ttl)
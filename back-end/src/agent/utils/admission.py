@@ -0,0 +1,125 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, Hashable, Optional
+
+
+class LLMOverloaded(Exception):
+    """Too many model calls in flight and queued; the request should be retried later."""
+
+
+class AdmissionControl:
+    """
+    At most `max_concurrency` model calls run at once. Up to `max_queue` more wait for a
+    slot, for no longer than `queue_timeout` seconds; anything beyond that is shed
+    straight away with LLMOverloaded rather than piling up behind the provider.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed = 0
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None):
+        if self._semaphore.locked():
+            if self.queued >= self.max_queue:
+                self.shed += 1
+                raise LLMOverloaded("LLM queue is full")
+            wait = self.queue_timeout if timeout is None else min(timeout, self.queue_timeout)
+            self.queued += 1
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), wait)
+            except asyncio.TimeoutError:
+                self.shed += 1
+                raise LLMOverloaded("Timed out waiting for an LLM slot")
+            finally:
+                self.queued -= 1
+        else:
+            await self._semaphore.acquire()
+        self.in_flight += 1
+        self.admitted += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queued,
+            "admitted": self.admitted,
+            "shed": self.shed,
+        }
+
+
+class TokenBucket:
+    """Spaces calls out to `rate` per second with bursts of up to `burst`; waiters go in order."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst or max(rate, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+        self.throttled = 0
+
+    async def acquire(self):
+        async with self._lock:
+            waited = False
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                if not waited:
+                    self.throttled += 1
+                    waited = True
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+    def stats(self) -> dict:
+        return {"rate": self.rate, "burst": self.capacity, "throttled": self.throttled}
+
+
+class SingleFlight:
+    """
+    Runs one call per key at a time: callers that arrive while a call with the same key
+    is in flight wait for its result instead of starting their own. Each caller, the one
+    that started it included, waits at most its own `timeout`; the shared call keeps
+    running when a caller gives up or goes away.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Future] = {}
+        self.coalesced = 0
+
+    def _finished(self, key: Hashable, task: asyncio.Future):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # retrieved so an unawaited failure is not reported as lost
+
+    async def run(self, key: Hashable, call: Callable[[], Awaitable], timeout: Optional[float] = None):
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(call())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._finished(key, done))
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        self.coalesced += 1
+        result = await asyncio.wait_for(asyncio.shield(task), timeout)
+        # followers get their own copy so nobody mutates a shared answer
+        return result.model_copy(deep=True) if hasattr(result, "model_copy") else result
+
+    def stats(self) -> dict:
+        return {"in_flight_keys": len(self._calls), "coalesced": self.coalesced}
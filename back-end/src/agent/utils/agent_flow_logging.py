@@ -1,8 +1,59 @@
-import shutil
-import pprint
+import atexit
 import json
+import logging
+import os
+import pprint
+import queue
+import random
+import shutil
+import sys
+import threading
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# set per HTTP request by the middleware in src/__init__.py and stamped on every event
+current_request_id: ContextVar[str] = ContextVar("current_request_id", default=None)
+
+SUCCESS = 25
+logging.addLevelName(SUCCESS, "SUCCESS")
+
+LEVELS = {
+    "debug": logging.DEBUG,
+    "info": logging.INFO,
+    "success": SUCCESS,
+    "warn": logging.WARNING,
+    "error": logging.ERROR,
+}
+
+
+def _jsonable(value):
+    if hasattr(value, "model_dump"):
+        return value.model_dump(mode="json")
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, event and extra when there is one."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        event = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": getattr(record, "flow_level", record.levelname.lower()),
+            "event": record.getMessage(),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            event["request_id"] = request_id
+        extra = getattr(record, "flow_extra", None)
+        if extra is not None:
+            event["extra"] = extra
+        return json.dumps(event, default=_jsonable, ensure_ascii=False)
+
+
+class PrettyFormatter(logging.Formatter):
+    """The coloured boxes for reading the flow in a terminal during development."""
 
-class FlowLogger:
     COLORS = {
         "info": "\033[94m",     # blue
         "warn": "\033[93m",     # yellow
@@ -13,22 +64,23 @@ class FlowLogger:
     }
 
     def __init__(self, width_limit: int = 100):
-        self.width_limit = width_limit
+        super().__init__()
+        term_width = shutil.get_terminal_size((80, 20)).columns
+        self.box_width = min(width_limit, term_width - 4)
 
     def _stringify_extra(self, extra):
         if isinstance(extra, str):
             return extra
         try:
-            return json.dumps(extra, indent=2, ensure_ascii=False)
+            return json.dumps(extra, indent=2, ensure_ascii=False, default=_jsonable)
         except (TypeError, ValueError):
             return pprint.pformat(extra, indent=2, width=80)
 
-    def print(self, title: str, level: str = "info", extra=None):
+    def format(self, record: logging.LogRecord) -> str:
+        level = getattr(record, "flow_level", "info")
         color = self.COLORS.get(level, self.COLORS["info"])
         reset = self.COLORS["reset"]
-        
-        term_width = shutil.get_terminal_size((80, 20)).columns
-        box_width = min(self.width_limit, term_width - 4)
+        box_width = self.box_width
         border = "+" + "-" * (box_width - 2) + "+"
 
         def wrap_lines(msg, width):
@@ -40,15 +92,93 @@ class FlowLogger:
                 lines.append(line)
             return lines
 
-        lines = wrap_lines(title.strip(), box_width - 4)
+        title = record.getMessage().strip()
+        request_id = getattr(record, "request_id", None)
+        if request_id is not None:
+            title = f"[{request_id}] {title}"
+        lines = wrap_lines(title, box_width - 4)
+        extra = getattr(record, "flow_extra", None)
         if extra is not None:
-            extra_str = self._stringify_extra(extra)
-            lines += wrap_lines(extra_str.strip(), box_width - 4)
+            lines += wrap_lines(self._stringify_extra(extra).strip(), box_width - 4)
 
-        print(color + border)
-        for line in lines:
-            print("| " + line.ljust(box_width - 4) + " |")
-        print(border + reset)
+        body = "\n".join("| " + line.ljust(box_width - 4) + " |" for line in lines)
+        return f"{color}{border}\n{body}\n{border}{reset}"
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Hands records to the listener thread as they are; drops them when the queue is full."""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # formatting happens on the listener thread, not on the request path
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_setup_lock = threading.Lock()
+_queue_handler = None
+
+
+def _flow_logger() -> logging.Logger:
+    """
+    The shared "soda.flow" logger. Records go through a bounded queue to a background
+    thread that formats and writes them to stdout: JSON lines by default,
+    LOG_FORMAT=pretty for the boxed output. LOG_LEVEL sets the threshold.
+    """
+    global _queue_handler
+    logger = logging.getLogger("soda.flow")
+    with _setup_lock:
+        if _queue_handler is None:
+            log_queue = queue.Queue(maxsize=int(os.environ.get("LOG_QUEUE_SIZE", 10000)))
+            stream = logging.StreamHandler(sys.stdout)
+            if os.environ.get("LOG_FORMAT", "json") == "pretty":
+                stream.setFormatter(PrettyFormatter())
+            else:
+                stream.setFormatter(JsonFormatter())
+            listener = QueueListener(log_queue, stream)
+            listener.start()
+            atexit.register(listener.stop)
+            _queue_handler = DroppingQueueHandler(log_queue)
+            logger.addHandler(_queue_handler)
+            logger.setLevel(LEVELS.get(os.environ.get("LOG_LEVEL", "info").lower(), logging.INFO))
+            logger.propagate = False
+    return logger
+
+
+def dropped_events() -> int:
+    """Records thrown away because the log queue was full."""
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+class FlowLogger:
+    """
+    Agent flow events. Calls only put a record on a queue; LOG_SAMPLE_RATE (0-1) keeps
+    that share of debug, info and success events, warnings and errors are always kept.
+    """
+
+    def __init__(self):
+        self.logger = _flow_logger()
+        self.sample_rate = float(os.environ.get("LOG_SAMPLE_RATE", 1))
+
+    def print(self, title: str, level: str = "info", extra=None):
+        levelno = LEVELS.get(level, logging.INFO)
+        if not self.logger.isEnabledFor(levelno):
+            return
+        if levelno < logging.WARNING and self.sample_rate < 1 and random.random() >= self.sample_rate:
+            return
+        self.logger.log(levelno, title, extra={
+            "flow_level": level,
+            "flow_extra": extra,
+            "request_id": current_request_id.get(),
+        })
 
     def info(self, title: str, extra=None):
         self.print(title, "info", extra)
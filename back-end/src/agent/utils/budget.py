@@ -0,0 +1,66 @@
+import os
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+
+class BudgetExhausted(Exception):
+    pass
+
+
+class RequestBudget:
+    """
+    Hard limits for one agent request: a wall-clock deadline plus a cap on model calls
+    (retries included) and on tokens. LLM.send checks it before every call.
+    """
+
+    def __init__(
+        self,
+        max_calls: Optional[int] = None,
+        max_tokens: Optional[int] = None,
+        deadline_seconds: Optional[float] = None,
+    ):
+        self.max_calls = max_calls if max_calls is not None else int(os.environ.get("AGENT_MAX_LLM_CALLS", 6))
+        self.max_tokens = max_tokens if max_tokens is not None else int(os.environ.get("AGENT_MAX_TOKENS", 8000))
+        self.deadline_seconds = (
+            deadline_seconds if deadline_seconds is not None else float(os.environ.get("AGENT_DEADLINE_SECONDS", 30))
+        )
+        self.started = time.monotonic()
+        self.calls = 0
+        self.tokens = 0
+        self.exhausted_reason = None
+
+    def remaining_time(self) -> float:
+        return max(self.deadline_seconds - (time.monotonic() - self.started), 0.0)
+
+    def calls_left(self) -> int:
+        return max(self.max_calls - self.calls, 0)
+
+    def check(self):
+        """Raises BudgetExhausted when no further model call fits in the budget."""
+        if self.remaining_time() <= 0:
+            self.exhausted_reason = "deadline"
+        elif self.calls_left() <= 0:
+            self.exhausted_reason = "calls"
+        elif self.tokens >= self.max_tokens:
+            self.exhausted_reason = "tokens"
+        if self.exhausted_reason:
+            raise BudgetExhausted(self.exhausted_reason)
+
+    def record_call(self):
+        self.calls += 1
+
+    def record_tokens(self, tokens: int):
+        self.tokens += tokens
+
+    def report(self) -> dict:
+        return {
+            "llm_calls": self.calls,
+            "tokens": self.tokens,
+            "elapsed_ms": round((time.monotonic() - self.started) * 1000),
+            "exhausted": self.exhausted_reason,
+        }
+
+
+# budget of the request being handled on this thread / task, read by LLM.send and its hooks
+current_budget: ContextVar[Optional[RequestBudget]] = ContextVar("current_budget", default=None)
@@ -0,0 +1,36 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+class LatencyStats:
+    """Thread-safe call count and timings for one code path."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    @contextmanager
+    def time(self):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg_ms": self.total / self.count * 1000 if self.count else 0.0,
+                "max_ms": self.max * 1000,
+                "total_ms": self.total * 1000,
+            }
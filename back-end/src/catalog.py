@@ -0,0 +1,174 @@
+import hashlib
+import os
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+
+from sqlmodel import Session, select
+
+from .models import Product, ProductOut, catalog_fingerprint, engine
+
+
+class ProductCatalog:
+    """
+    In-memory copy of the product table, indexed by id.
+    The service layer writes every product and stock change through to it after
+    committing. Changes made by other workers or processes are noticed through the
+    catalog fingerprint (product count and sum of row versions), which is read at most
+    every CATALOG_SYNC_INTERVAL seconds and triggers a reload when it no longer matches
+    the copy; a full reload also happens every CATALOG_TTL seconds.
+    """
+
+    def __init__(self, ttl: Optional[float] = None, sync_interval: Optional[float] = None):
+        self.ttl = ttl if ttl is not None else float(os.environ.get("CATALOG_TTL", 30))
+        if sync_interval is None:
+            sync_interval = float(os.environ.get("CATALOG_SYNC_INTERVAL", 1))
+        self.sync_interval = sync_interval
+        self._lock = threading.Lock()
+        self._by_id: Dict[int, ProductOut] = {}
+        self._loaded_at: Optional[float] = None
+        self._checked_at: Optional[float] = None
+        # row version of every product in the copy and the fingerprint they add up to
+        self._versions: Dict[int, int] = {}
+        self._fingerprint: Optional[Tuple[int, int]] = None
+        self._generation = 0
+        self._digest: Optional[str] = None
+        # write-throughs made while nothing is loaded, as (generation, change) pairs
+        self._pending: List[Tuple[int, Callable[[Dict[int, ProductOut]], None]]] = []
+
+    def _load(self):
+        generation = self._generation
+        with Session(engine) as session:
+            rows = session.exec(select(Product)).all()
+            products = [ProductOut.model_validate(p, from_attributes=True) for p in rows]
+            # taken from the rows themselves, so it describes exactly this snapshot
+            versions = {p.id: p.version for p in rows}
+        with self._lock:
+            stale = generation != self._generation
+            # a write that landed while we were reading makes this snapshot stale; keep
+            # the write-through state and let the next read try again
+            if stale and self._loaded_at is not None:
+                return
+            by_id = {p.id: p for p in products}
+            # with nothing loaded there is no state to keep, so serve the snapshot with
+            # the writes made during the load applied on top (they carry absolute values)
+            for written_at, change in self._pending:
+                if written_at > generation:
+                    change(by_id)
+            self._pending = []
+            self._by_id = dict(sorted(by_id.items()))
+            self._versions = versions
+            self._loaded_at = time.monotonic()
+            if stale:
+                # the snapshot may still miss other workers' changes: check on the next read
+                self._fingerprint, self._checked_at = None, None
+            else:
+                self._fingerprint, self._checked_at = (len(versions), sum(versions.values())), self._loaded_at
+            self._digest = None
+
+    @property
+    def fresh(self) -> bool:
+        """False when the next read has to go to the database first."""
+        loaded_at, checked_at = self._loaded_at, self._checked_at
+        if loaded_at is None or checked_at is None:
+            return False
+        now = time.monotonic()
+        return now - loaded_at <= self.ttl and now - checked_at <= self.sync_interval
+
+    def _ensure_loaded(self):
+        if self.fresh:
+            return
+        loaded_at = self._loaded_at
+        if loaded_at is not None and time.monotonic() - loaded_at <= self.ttl:
+            with Session(engine) as session:
+                fingerprint = catalog_fingerprint(session)
+            if fingerprint == self._fingerprint:
+                self._checked_at = time.monotonic()
+                return
+        self._load()
+
+    def _write(
+        self,
+        change: Callable[[Dict[int, ProductOut]], None],
+        product_id: int,
+        version: Optional[int],
+        removed: bool = False,
+    ):
+        """Applies a write-through to the copy; called with the lock held."""
+        change(self._by_id)
+        self._changed(product_id, version, removed)
+        if self._loaded_at is None:
+            self._pending.append((self._generation, change))
+
+    def _changed(self, product_id: Optional[int] = None, version: Optional[int] = None, removed: bool = False):
+        self._generation += 1
+        self._digest = None
+        if product_id is None or self._fingerprint is None:
+            return
+        # our own write only keeps the copy in step when it is the very next change to that
+        # row; otherwise another worker's change is still unseen and the next check reloads
+        count, total = self._fingerprint
+        previous = self._versions.pop(product_id, None)
+        if removed and previous is not None:
+            self._fingerprint = (count - 1, total - previous)
+        elif not removed and version is not None and version == (previous or 0) + 1:
+            self._versions[product_id] = version
+            self._fingerprint = (count + (previous is None), total + 1)
+        else:
+            self._fingerprint = None
+
+    def version(self) -> Optional[Tuple[int, int]]:
+        """The catalog fingerprint this copy reflects, checked against the database as for any read."""
+        self._ensure_loaded()
+        return self._fingerprint
+
+    def products(self, skip: int = 0, limit: int = 100) -> List[ProductOut]:
+        self._ensure_loaded()
+        with self._lock:
+            return list(self._by_id.values())[skip:skip + limit]
+
+    def get(self, product_id: int) -> Optional[ProductOut]:
+        self._ensure_loaded()
+        return self._by_id.get(product_id)
+
+    def etag(self, skip: int = 0, limit: int = 100) -> str:
+        """Content-based, so every worker hands out the same tag for the same data."""
+        self._ensure_loaded()
+        with self._lock:
+            if self._digest is None:
+                content = "|".join(f"{p.id}:{p.name}:{p.stock}:{p.price}" for p in self._by_id.values())
+                self._digest = hashlib.sha1(content.encode()).hexdigest()[:20]
+            return f'"{self._digest}-{skip}-{limit}"'
+
+    def put(self, product: Product, version: Optional[int] = None):
+        """Write-through for a created or updated product."""
+        entry = ProductOut.model_validate(product, from_attributes=True)
+
+        def change(by_id):
+            by_id[entry.id] = entry
+
+        with self._lock:
+            self._write(change, entry.id, version)
+            self._by_id = dict(sorted(self._by_id.items()))
+
+    def set_stock(self, product_id: int, stock: int, version: Optional[int] = None):
+        """Write-through of the stock level a sale or a cancelled sale committed."""
+        def change(by_id):
+            entry = by_id.get(product_id)
+            if entry is not None:
+                by_id[product_id] = entry.model_copy(update={"stock": stock})
+
+        with self._lock:
+            self._write(change, product_id, version)
+
+    def remove(self, product_id: int):
+        with self._lock:
+            self._write(lambda by_id: by_id.pop(product_id, None), product_id, None, removed=True)
+
+    def invalidate(self):
+        with self._lock:
+            self._loaded_at = None
+            self._changed()
+
+
+catalog = ProductCatalog()
@@ -1,18 +1,75 @@
-from sqlmodel import SQLModel, Field, create_engine, Session, select
-from datetime import datetime
-from typing import Optional, List
+from sqlmodel import SQLModel, Field, create_engine, Session, select, func, update, delete, col
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+import os
+from datetime import datetime, timedelta, timezone
+from typing import Optional, List, Tuple
 from pydantic import BaseModel
+from dotenv import load_dotenv
 
-engine = create_engine("sqlite:///./soda_ai.db", echo=True)
+load_dotenv()
+
+def env_flag(name: str, default: bool = False) -> bool:
+    return os.environ.get(name, str(default)).strip().lower() in ("1", "true", "yes", "on")
+
+def set_sqlite_pragmas(dbapi_connection, connection_record):
+    """
+    WAL lets readers run alongside the single writer, and busy_timeout makes a writer
+    wait for the lock instead of failing with "database is locked".
+    """
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute(f"PRAGMA busy_timeout={int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 5000))}")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA temp_store=MEMORY")
+    cursor.execute("PRAGMA cache_size=-16000")
+    cursor.close()
+
+def make_engine(url: str):
+    """
+    Builds an engine from the DB_* settings: SQL echo is off unless DB_ECHO is set,
+    and the connection pool is sized by DB_POOL_SIZE / DB_MAX_OVERFLOW.
+    """
+    options = {
+        "echo": env_flag("DB_ECHO"),
+        "pool_pre_ping": env_flag("DB_POOL_PRE_PING", True),
+    }
+    if url.startswith("sqlite"):
+        options["connect_args"] = {"check_same_thread": False}
+    # in-memory SQLite ("sqlite://", "sqlite:///:memory:") gets a single-connection pool without these
+    if not (url.startswith("sqlite") and make_url(url).database in (None, "", ":memory:")):
+        options.update(
+            pool_size=int(os.environ.get("DB_POOL_SIZE", 5)),
+            max_overflow=int(os.environ.get("DB_MAX_OVERFLOW", 10)),
+            pool_timeout=float(os.environ.get("DB_POOL_TIMEOUT", 30)),
+            pool_recycle=int(os.environ.get("DB_POOL_RECYCLE", 1800)),
+        )
+    new_engine = create_engine(url, **options)
+    if new_engine.dialect.name == "sqlite":
+        event.listen(new_engine, "connect", set_sqlite_pragmas)
+    return new_engine
+
+DATABASE_URL = os.environ.get("DATABASE_URL", "sqlite:///./soda_ai.db")
+DATABASE_READ_URL = os.environ.get("DATABASE_READ_URL")
+
+engine = make_engine(DATABASE_URL)
+# read-only endpoints go to a replica when DATABASE_READ_URL is set, otherwise to the primary
+read_engine = make_engine(DATABASE_READ_URL) if DATABASE_READ_URL else engine
 
 class MessageInput(BaseModel):
     message: str
+    # optional conversation id; follow-ups like "make that three" are resolved against it
+    session_id: Optional[str] = Field(default=None, max_length=128)
 
 class Product(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str = Field(index=True, unique=True)
     stock: int
     price: int
+    # raised by one in the same UPDATE as every change to the row; see catalog_fingerprint
+    version: int = Field(default=1)
 
 class ProductCreate(SQLModel):
     name: str
@@ -28,20 +85,209 @@ class ProductOut(SQLModel):
 class Sale(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     product_id: int = Field(foreign_key="product.id")
-    timestamp: datetime = Field(default_factory=datetime.utcnow)
+    quantity: int = Field(default=1)
+    timestamp: datetime = Field(default_factory=lambda: datetime.now(timezone.utc), index=True)
+
+class ProductSales(SQLModel, table=True):
+    """Running total of units sold per product, kept in step with the sale table."""
+    product_id: int = Field(foreign_key="product.id", primary_key=True)
+    total_sold: int = Field(default=0)
 
 class SaleCreate(SQLModel):
     product_name: str
     quantity: int
 
+class SaleBulkCreate(SQLModel):
+    items: List[SaleCreate]
+
 class SaleOut(SQLModel):
     id: int
     product_name: str
     timestamp: datetime
+    quantity: int = 1
+
+class SaleLineResult(BaseModel):
+    product_name: str
+    quantity: int
+    success: bool
+    detail: Optional[str] = None
+    sale: Optional[SaleOut] = None
+
+class SaleBatchOut(BaseModel):
+    success: bool
+    lines: List[SaleLineResult]
+
+class SalePage(BaseModel):
+    items: List[SaleOut]
+    next_cursor: Optional[str] = None
 
 class MostSoldItem(BaseModel):
     product_name: str
     total_sold: int
 
+class SalesAggregateMismatch(BaseModel):
+    product_id: int
+    aggregate_total: int
+    sales_total: int
+
+class SalesAggregateCheck(BaseModel):
+    consistent: bool
+    mismatches: List[SalesAggregateMismatch]
+
 def create_db_and_tables():
     SQLModel.metadata.create_all(engine)
+    # create_all skips tables that already exist, including indexes added to them later
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
+
+def migrate_sale_quantity():
+    """
+    Adds the sale.quantity column to databases created before it existed and compacts
+    the old one-row-per-unit sales into one row per order line. Runs once: it is a
+    no-op as soon as the column is present.
+    """
+    columns = {column["name"] for column in inspect(engine).get_columns("sale")}
+    if "quantity" in columns:
+        return
+    with Session(engine) as session:
+        session.exec(text("ALTER TABLE sale ADD COLUMN quantity INTEGER NOT NULL DEFAULT 1"))
+        merged = compact_unit_sales(session)
+        session.commit()
+    print(f"Migrated sale table to quantity rows, merged {merged} per-unit rows.")
+
+def migrate_product_version():
+    """Adds the product.version column to databases created before it existed."""
+    columns = {column["name"] for column in inspect(engine).get_columns("product")}
+    if "version" in columns:
+        return
+    with Session(engine) as session:
+        session.exec(text("ALTER TABLE product ADD COLUMN version INTEGER NOT NULL DEFAULT 1"))
+        session.commit()
+    print("Migrated product table to versioned rows.")
+
+def compact_unit_sales(session: Session, window: timedelta = timedelta(seconds=1)) -> int:
+    """
+    Merges runs of per-unit sale rows written by a single order. The old create_sale
+    inserted them with consecutive ids, the same product and timestamps a few
+    microseconds apart, so a run is kept together while those three hold.
+    Returns how many rows were folded into another one.
+    """
+    rows = session.exec(
+        select(Sale.id, Sale.product_id, Sale.timestamp).order_by(Sale.id)
+        .execution_options(yield_per=1000)
+    )
+    runs, current = [], None
+    for sale_id, product_id, timestamp in rows:
+        if (
+            current is not None
+            and current["product_id"] == product_id
+            and current["last_id"] == sale_id - 1
+            and timestamp - current["timestamp"] < window
+        ):
+            current["last_id"] = sale_id
+            current["quantity"] += 1
+            continue
+        if current is not None and current["quantity"] > 1:
+            runs.append(current)
+        current = {"id": sale_id, "last_id": sale_id, "product_id": product_id, "timestamp": timestamp, "quantity": 1}
+    if current is not None and current["quantity"] > 1:
+        runs.append(current)
+
+    merged = 0
+    for run in runs:
+        session.exec(update(Sale).where(Sale.id == run["id"]).values(quantity=run["quantity"]))
+        session.exec(delete(Sale).where(col(Sale.id) > run["id"], col(Sale.id) <= run["last_id"]))
+        merged += run["quantity"] - 1
+    return merged
+
+def add_to_sales_aggregate(session: Session, product_id: int, quantity: int):
+    """
+    Adds `quantity` (negative to subtract) to the product's running total.
+    Runs inside the caller's transaction so the aggregate commits or rolls back with the sale.
+    SQLite and PostgreSQL get a single atomic upsert, so two first sales of a product
+    can never both try to insert its row.
+    """
+    dialect_insert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(session.get_bind().dialect.name)
+    if dialect_insert is not None:
+        session.exec(
+            dialect_insert(ProductSales)
+            .values(product_id=product_id, total_sold=max(quantity, 0))
+            .on_conflict_do_update(
+                index_elements=[ProductSales.product_id],
+                set_={"total_sold": ProductSales.total_sold + quantity},
+            )
+        )
+        return
+    result = session.exec(
+        update(ProductSales)
+        .where(ProductSales.product_id == product_id)
+        .values(total_sold=ProductSales.total_sold + quantity)
+    )
+    if result.rowcount == 0:
+        session.add(ProductSales(product_id=product_id, total_sold=max(quantity, 0)))
+
+def catalog_fingerprint(session: Session) -> Tuple[int, int]:
+    """
+    (number of products, sum of their versions). Every insert, update and delete of a
+    product changes it, and writers only touch their own product rows, so orders for
+    different products never wait on each other to keep it current.
+    """
+    count, total = session.exec(select(func.count(), func.coalesce(func.sum(Product.version), 0))).one()
+    return count, total
+
+def seed_products(products: List[dict]) -> int:
+    """
+    Inserts the products whose name is not taken yet and leaves existing ones alone, so
+    live stock is never reset. Returns how many were added; safe to run concurrently.
+    """
+    products = [dict(p, name=p["name"].lower()) for p in products]
+    with Session(engine) as session:
+        dialect_insert = {"sqlite": sqlite_insert, "postgresql": postgresql_insert}.get(engine.dialect.name)
+        if dialect_insert is not None:
+            result = session.exec(
+                dialect_insert(Product).values(products).on_conflict_do_nothing(index_elements=[Product.name])
+            )
+            added = result.rowcount
+        else:
+            names = [p["name"] for p in products]
+            existing = set(session.exec(select(Product.name).where(col(Product.name).in_(names))).all())
+            missing = [p for p in products if p["name"] not in existing]
+            session.add_all(Product(**p) for p in missing)
+            added = len(missing)
+        session.commit()
+    return added
+
+def sales_totals_from_sales(session: Session):
+    """Units sold per product computed straight from the sale table."""
+    rows = session.exec(select(Sale.product_id, func.sum(Sale.quantity)).group_by(Sale.product_id)).all()
+    return {product_id: total for product_id, total in rows}
+
+def rebuild_sales_aggregate(session: Session):
+    """Recomputes the whole aggregate table from the sale table."""
+    session.exec(delete(ProductSales))
+    for product_id, total in sales_totals_from_sales(session).items():
+        session.add(ProductSales(product_id=product_id, total_sold=total))
+    session.commit()
+
+def backfill_sales_aggregate():
+    """One-time backfill: only runs when the aggregate table is still empty."""
+    with Session(engine) as session:
+        if session.exec(select(ProductSales).limit(1)).first() is None:
+            rebuild_sales_aggregate(session)
+            print("Sales aggregate backfilled from sale history.")
+
+def check_sales_aggregate(session: Session) -> SalesAggregateCheck:
+    """Compares the maintained aggregate against a full count of the sale table."""
+    expected = sales_totals_from_sales(session)
+    actual = {row.product_id: row.total_sold for row in session.exec(select(ProductSales)).all()}
+    mismatches = [
+        SalesAggregateMismatch(
+            product_id=product_id,
+            aggregate_total=actual.get(product_id, 0),
+            sales_total=expected.get(product_id, 0),
+        )
+        for product_id in sorted(set(expected) | set(actual))
+        if actual.get(product_id, 0) != expected.get(product_id, 0)
+    ]
+    return SalesAggregateCheck(consistent=not mismatches, mismatches=mismatches)
@@ -0,0 +1,169 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .agent.utils.agent_flow_logging import FlowLogger, current_request_id, dropped_events
+
+logger = FlowLogger()
+
+SLOW_SPAN_MS = float(os.environ.get("SLOW_SPAN_MS", 1000))
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+DB_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1)
+SIZE_BUCKETS = (128, 256, 512, 1024, 2048, 4096, 8192)
+
+_metrics = []
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(pairs: Iterable[Tuple[str, str]]) -> str:
+    pairs = list(pairs)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name, self.help_text, self.label_names = name, help_text, labels
+        self._lock = threading.Lock()
+        self._values: Dict[tuple, float] = {}
+        _metrics.append(self)
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} counter"
+        with self._lock:
+            values = dict(self._values)
+        for key, value in values.items():
+            yield f"{self.name}{_labels(zip(self.label_names, key))} {value}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets=LATENCY_BUCKETS):
+        self.name, self.help_text, self.label_names = name, help_text, labels
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: Dict[tuple, list] = {}
+        _metrics.append(self)
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.label_names)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        yield f"# HELP {self.name} {self.help_text}"
+        yield f"# TYPE {self.name} histogram"
+        with self._lock:
+            snapshot = {key: (list(counts), total) for key, (counts, total) in self._series.items()}
+        for key, (counts, total) in snapshot.items():
+            pairs = list(zip(self.label_names, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += count
+                yield f"{self.name}_bucket{_labels(pairs + [('le', bound)])} {cumulative}"
+            yield f"{self.name}_sum{_labels(pairs)} {total}"
+            yield f"{self.name}_count{_labels(pairs)} {cumulative}"
+
+
+HTTP_SECONDS = Histogram(
+    "http_request_duration_seconds", "Time to produce the response headers", ("method", "route", "status"),
+)
+STAGE_SECONDS = Histogram("agent_stage_duration_seconds", "Time spent in each agent stage", ("stage", "outcome"))
+LLM_SECONDS = Histogram(
+    "llm_request_duration_seconds", "LLM calls including instructor retries", ("model", "response_model", "outcome"),
+)
+LLM_TOKENS = Counter("llm_tokens_total", "Tokens reported by the LLM API", ("model",))
+LLM_RETRIES = Counter("llm_retries_total", "Extra attempts instructor made after a failed validation", ("model",))
+DB_SECONDS = Histogram("db_query_duration_seconds", "Database statement execution time", ("operation",), DB_BUCKETS)
+SESSION_BYTES = Histogram(
+    "agent_session_state_bytes", "Size of a conversation's stored state after each turn", (), SIZE_BUCKETS,
+)
+
+
+@contextmanager
+def span(stage: str, **attributes):
+    """
+    Times one stage of a request into agent_stage_duration_seconds and logs it with the
+    request id: at debug level normally, as a warning when it takes SLOW_SPAN_MS or more.
+    The yielded dict can be filled in while the stage runs and is logged with it.
+    """
+    started = time.perf_counter()
+    outcome = "ok"
+    try:
+        yield attributes
+    except BaseException:
+        outcome = "error"
+        raise
+    finally:
+        duration = time.perf_counter() - started
+        STAGE_SECONDS.observe(duration, stage=stage, outcome=outcome)
+        level = "warn" if duration * 1000 >= SLOW_SPAN_MS else "debug"
+        logger.print(f"span {stage}", level, {"duration_ms": round(duration * 1000, 2), "outcome": outcome, **attributes})
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    operation = statement.lstrip().split(None, 1)[0].upper() if statement.strip() else "OTHER"
+    DB_SECONDS.observe(time.perf_counter() - started, operation=operation)
+
+
+def _query_failed(context):
+    # after_cursor_execute never fires for a failed statement
+    conn = context.connection
+    if conn is not None and conn.info.get("query_started"):
+        conn.info["query_started"].pop()
+
+
+def instrument_db():
+    """Times every statement run by any engine into db_query_duration_seconds."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
+        event.listen(Engine, "handle_error", _query_failed)
+
+
+def _gauges(prefix: str, stats: dict):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _gauges(name, value)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            yield f"# TYPE {name} gauge"
+            yield f"{name} {value}"
+
+
+def render_metrics(agent_stats: dict) -> str:
+    """Everything above plus the agent's own counters, in Prometheus text format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    lines.extend(_gauges("agent", agent_stats))
+    lines.append("# TYPE log_dropped_events gauge")
+    lines.append(f"log_dropped_events {dropped_events()}")
+    return "\n".join(lines) + "\n"
+
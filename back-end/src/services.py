@@ -0,0 +1,330 @@
+import base64
+import csv
+import io
+import json
+from collections import Counter
+from datetime import datetime, timezone
+from typing import Callable, List, Optional
+
+from sqlmodel import Session, select, insert, update, delete, col, and_, or_
+
+from .catalog import catalog
+from .models import (
+    Product, ProductCreate, MostSoldItem, ProductSales,
+    Sale, SaleCreate, SaleOut, SalePage, SaleLineResult, SaleBatchOut,
+    read_engine, add_to_sales_aggregate,
+)
+
+EXPORT_CHUNK_SIZE = 1000
+
+
+class ServiceError(Exception):
+    status_code = 400
+
+    def __init__(self, detail: str):
+        super().__init__(detail)
+        self.detail = detail
+
+
+class NotFoundError(ServiceError):
+    status_code = 404
+
+
+class InvalidRequestError(ServiceError):
+    status_code = 400
+
+
+_stock_listeners: List[Callable[[], None]] = []
+
+
+def on_stock_change(listener: Callable[[], None]):
+    """Registers a callback run after every committed change to products, stock or sales."""
+    _stock_listeners.append(listener)
+
+
+def _stock_changed():
+    for listener in _stock_listeners:
+        listener()
+
+
+def create_product(session: Session, product: ProductCreate) -> Product:
+    product_name_lower = product.name.lower()
+    existing_product = session.exec(select(Product).where(Product.name == product_name_lower)).first()
+    if existing_product:
+        session.exec(
+            update(Product)
+            .where(Product.id == existing_product.id)
+            .values(stock=Product.stock + product.stock, price=product.price, version=Product.version + 1)
+        )
+        session.commit()
+        session.refresh(existing_product)
+        catalog.put(existing_product, existing_product.version)
+        _stock_changed()
+        return existing_product
+    else:
+        db_product = Product.from_orm(product)
+        db_product.name = product_name_lower
+        session.add(db_product)
+        session.commit()
+        session.refresh(db_product)
+        catalog.put(db_product, db_product.version)
+        _stock_changed()
+        return db_product
+
+
+def get_product(session: Session, product_id: int) -> Product:
+    product = session.get(Product, product_id)
+    if product is None:
+        raise NotFoundError("Product not found")
+    return product
+
+
+def update_product(session: Session, product_id: int, product: ProductCreate) -> Product:
+    db_product = get_product(session, product_id)
+
+    product_data = product.dict(exclude_unset=True)
+    for key, value in product_data.items():
+        setattr(db_product, key, value)
+    # incremented by the database, so two concurrent updates can't both claim the same version
+    db_product.version = Product.version + 1
+
+    session.add(db_product)
+    session.commit()
+    session.refresh(db_product)
+    catalog.put(db_product, db_product.version)
+    _stock_changed()
+    return db_product
+
+
+def delete_product(session: Session, product_id: int):
+    product = get_product(session, product_id)
+    session.delete(product)
+    session.commit()
+    catalog.remove(product_id)
+    _stock_changed()
+
+
+def _place_lines(session: Session, lines: List[SaleCreate]):
+    """
+    Sells every line of an order in one transaction or none of them.
+    Products are looked up with one query and stock is taken with a conditional
+    UPDATE ... WHERE stock >= n per product, so a concurrent sale can never push it
+    below zero; all sale rows then go in with a single executemany INSERT.
+    Returns one error (or None) per line and the sales written, empty on failure.
+    """
+    if not lines:
+        raise InvalidRequestError("Order must contain at least one item")
+    names = {line.product_name for line in lines}
+    products = {p.name: p for p in session.exec(select(Product).where(col(Product.name).in_(names))).all()}
+    errors: List[Optional[ServiceError]] = []
+    requested = Counter()
+    for line in lines:
+        product = products.get(line.product_name)
+        if product is None:
+            errors.append(NotFoundError("Product not found"))
+        elif line.quantity <= 0:
+            errors.append(InvalidRequestError("Quantity must be greater than zero"))
+        else:
+            errors.append(None)
+            requested[product.name] += line.quantity
+
+    if any(errors):
+        # the order fails anyway, so only report stock problems without touching stock
+        short = {name for name, quantity in requested.items() if products[name].stock < quantity}
+    else:
+        short = set()
+        stock_left = {}
+        for name, quantity in requested.items():
+            stock_left[name] = session.exec(
+                update(Product)
+                .where(Product.id == products[name].id, Product.stock >= quantity)
+                .values(stock=Product.stock - quantity, version=Product.version + 1)
+                .returning(Product.stock, Product.version)
+            ).one_or_none()
+            if stock_left[name] is None:
+                short.add(name)
+    for index, line in enumerate(lines):
+        if errors[index] is None and line.product_name in short:
+            errors[index] = InvalidRequestError("Not enough stock to fulfill the sale")
+    if any(errors):
+        session.rollback()
+        return errors, []
+
+    timestamp = datetime.now(timezone.utc)
+    rows = [
+        {"product_id": products[line.product_name].id, "quantity": line.quantity, "timestamp": timestamp}
+        for line in lines
+    ]
+    sale_ids = session.exec(insert(Sale).returning(Sale.id, sort_by_parameter_order=True), params=rows).scalars().all()
+    for name, quantity in requested.items():
+        add_to_sales_aggregate(session, products[name].id, quantity)
+    session.commit()
+    # the committed values, not deltas, so a catalog reload racing with us can't count a sale twice
+    for name, (stock, version) in stock_left.items():
+        catalog.set_stock(products[name].id, stock, version)
+    _stock_changed()
+    sales = [
+        SaleOut(id=sale_id, product_name=line.product_name, timestamp=timestamp, quantity=line.quantity)
+        for sale_id, line in zip(sale_ids, lines)
+    ]
+    return errors, sales
+
+
+def place_order(session: Session, lines: List[SaleCreate]) -> SaleBatchOut:
+    """Places a multi-line order atomically and reports the outcome of every line."""
+    errors, sales = _place_lines(session, lines)
+    if sales:
+        return SaleBatchOut(success=True, lines=[
+            SaleLineResult(product_name=sale.product_name, quantity=sale.quantity, success=True, sale=sale)
+            for sale in sales
+        ])
+    return SaleBatchOut(success=False, lines=[
+        SaleLineResult(
+            product_name=line.product_name,
+            quantity=line.quantity,
+            success=False,
+            detail=error.detail if error else "Not placed because another item in the order failed",
+        )
+        for line, error in zip(lines, errors)
+    ])
+
+
+def create_sale(session: Session, sale: SaleCreate) -> List[SaleOut]:
+    errors, sales = _place_lines(session, [sale])
+    if errors[0] is not None:
+        raise errors[0]
+    return sales
+
+
+def list_sales(session: Session, skip: int = 0, limit: int = 100) -> List[SaleOut]:
+    query = sale_columns_query().order_by(Sale.id).offset(skip).limit(limit)
+    return [sale_row_out(row) for row in session.exec(query).all()]
+
+
+def delete_sale(session: Session, sale_id: int):
+    sale = session.get(Sale, sale_id)
+    if sale is None:
+        raise NotFoundError("Sale not found")
+    # only the request that actually removes the row gives the stock back
+    deleted = session.exec(delete(Sale).where(Sale.id == sale_id))
+    if deleted.rowcount != 1:
+        session.rollback()
+        raise NotFoundError("Sale not found")
+    restocked = session.exec(
+        update(Product)
+        .where(Product.id == sale.product_id)
+        .values(stock=Product.stock + sale.quantity, version=Product.version + 1)
+        .returning(Product.stock, Product.version)
+    ).one_or_none()
+    add_to_sales_aggregate(session, sale.product_id, -sale.quantity)
+    session.commit()
+    if restocked is not None:
+        catalog.set_stock(sale.product_id, *restocked)
+    _stock_changed()
+
+
+def as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    """Query parameters without an offset are taken to be UTC, like stored timestamps."""
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def encode_sale_cursor(timestamp: datetime, sale_id: int) -> str:
+    raw = json.dumps({"ts": timestamp.isoformat(), "id": sale_id})
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_sale_cursor(cursor: str):
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return as_utc(datetime.fromisoformat(data["ts"])), int(data["id"])
+    except (ValueError, KeyError, TypeError):
+        raise InvalidRequestError("Invalid cursor")
+
+
+def sale_columns_query():
+    """(id, product name, timestamp, quantity) rows, joined in SQL rather than loading ORM objects."""
+    return (
+        select(Sale.id, Product.name, Sale.timestamp, Sale.quantity)
+        .join(Product, Product.id == Sale.product_id, isouter=True)
+    )
+
+
+def sale_rows_query(start: Optional[datetime] = None, end: Optional[datetime] = None):
+    """Sales joined with their product name, oldest first, optionally limited to [start, end)."""
+    query = sale_columns_query().order_by(Sale.timestamp, Sale.id)
+    if start is not None:
+        query = query.where(Sale.timestamp >= as_utc(start))
+    if end is not None:
+        query = query.where(Sale.timestamp < as_utc(end))
+    return query
+
+
+def sale_row_out(row) -> SaleOut:
+    sale_id, product_name, timestamp, quantity = row
+    return SaleOut(id=sale_id, product_name=product_name or "Unknown", timestamp=timestamp, quantity=quantity)
+
+
+def sale_history(session: Session, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[SaleOut]:
+    return [sale_row_out(row) for row in session.exec(sale_rows_query(start, end)).all()]
+
+
+def sale_history_page(
+    session: Session,
+    limit: int = 100,
+    cursor: Optional[str] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> SalePage:
+    """
+    Keyset pagination over (timestamp, id). Pass the returned next_cursor back to get
+    the following page; it is None on the last page.
+    """
+    query = sale_rows_query(start, end)
+    if cursor is not None:
+        after_timestamp, after_id = decode_sale_cursor(cursor)
+        query = query.where(or_(
+            Sale.timestamp > after_timestamp,
+            and_(Sale.timestamp == after_timestamp, Sale.id > after_id),
+        ))
+    rows = session.exec(query.limit(limit + 1)).all()
+    items = [sale_row_out(row) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = encode_sale_cursor(items[-1].timestamp, items[-1].id)
+    return SalePage(items=items, next_cursor=next_cursor)
+
+
+def export_sale_rows(query, export_format: str, bind=read_engine):
+    """Streams rows in chunks of EXPORT_CHUNK_SIZE with a session of its own."""
+    with Session(bind) as session:
+        result = session.exec(query.execution_options(yield_per=EXPORT_CHUNK_SIZE))
+        if export_format == "csv":
+            buffer = io.StringIO()
+            writer = csv.writer(buffer)
+            writer.writerow(["id", "product_name", "timestamp", "quantity"])
+            for chunk in result.partitions():
+                for sale in map(sale_row_out, chunk):
+                    writer.writerow([sale.id, sale.product_name, sale.timestamp.isoformat(), sale.quantity])
+                yield buffer.getvalue()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():
+                yield buffer.getvalue()
+        else:
+            for chunk in result.partitions():
+                yield "".join(sale_row_out(row).model_dump_json() + "\n" for row in chunk)
+
+
+def most_sold(session: Session) -> List[MostSoldItem]:
+    rows = session.exec(
+        select(ProductSales.product_id, ProductSales.total_sold, Product.name)
+        .join(Product, Product.id == ProductSales.product_id, isouter=True)
+        .where(ProductSales.total_sold > 0)
+        .order_by(ProductSales.total_sold.desc(), ProductSales.product_id)
+    ).all()
+    return [
+        MostSoldItem(product_name=name or "Unknown", total_sold=total_sold)
+        for _, total_sold, name in rows
+    ]
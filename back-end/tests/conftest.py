@@ -0,0 +1,22 @@
+import os
+import tempfile
+
+# the engine is built when src.models is imported, so point it at a scratch database first
+os.environ["DATABASE_URL"] = f"sqlite:///{tempfile.mkdtemp(prefix='soda-tests-')}/test.db"
+os.environ.pop("DATABASE_READ_URL", None)
+
+import pytest
+from sqlmodel import Session, SQLModel
+
+from src.catalog import catalog
+from src.models import create_db_and_tables, engine
+
+
+@pytest.fixture
+def session():
+    """A session on freshly created, empty tables."""
+    SQLModel.metadata.drop_all(engine)
+    create_db_and_tables()
+    catalog.invalidate()
+    with Session(engine) as session:
+        yield session
@@ -0,0 +1,66 @@
+import sys
+
+from sqlmodel import Session, update
+
+from src.catalog import ProductCatalog
+from src.models import Product, ProductCreate, SaleCreate, catalog_fingerprint, engine
+from src.services import create_product, delete_product, place_order
+
+catalog_module = sys.modules["src.catalog"]
+
+
+def stock(catalog):
+    return {p.name: p.stock for p in catalog.products()}
+
+
+def test_write_during_the_first_load_keeps_the_snapshot(session, monkeypatch):
+    create_product(session, ProductCreate(name="coke", stock=5, price=5))
+    create_product(session, ProductCreate(name="fanta", stock=10, price=5))
+    catalog = ProductCatalog(ttl=60, sync_interval=60)
+    select = catalog_module.select
+
+    def sale_commits_while_loading(*entities):
+        monkeypatch.setattr(catalog_module, "select", select)
+        with Session(engine) as other:
+            other.exec(update(Product).where(Product.name == "coke").values(stock=3, version=Product.version + 1))
+            other.commit()
+        catalog.set_stock(1, 3, 2)
+        return select(*entities)
+
+    monkeypatch.setattr(catalog_module, "select", sale_commits_while_loading)
+    products = catalog.products()
+
+    assert [(p.name, p.stock) for p in products] == [("coke", 3), ("fanta", 10)]
+    assert not catalog.fresh
+    assert catalog.get(1).stock == 3
+    assert catalog.fresh
+
+
+def test_changes_made_elsewhere_are_noticed(session):
+    create_product(session, ProductCreate(name="coke", stock=5, price=5))
+    create_product(session, ProductCreate(name="fanta", stock=10, price=5))
+    other_worker = ProductCatalog(ttl=60, sync_interval=0)
+    assert stock(other_worker) == {"coke": 5, "fanta": 10}
+
+    place_order(session, [SaleCreate(product_name="coke", quantity=2)])
+    assert stock(other_worker) == {"coke": 3, "fanta": 10}
+
+    delete_product(session, 2)
+    assert stock(other_worker) == {"coke": 3}
+    assert other_worker.version() == catalog_fingerprint(session)
+
+
+def test_own_writes_keep_the_copy_in_step(session, monkeypatch):
+    create_product(session, ProductCreate(name="coke", stock=5, price=5))
+    catalog = ProductCatalog(ttl=60, sync_interval=0)
+    monkeypatch.setattr(sys.modules["src.services"], "catalog", catalog)
+    catalog.products()
+    loads = []
+    monkeypatch.setattr(catalog, "_load", lambda: loads.append(1))
+
+    place_order(session, [SaleCreate(product_name="coke", quantity=2)])
+    create_product(session, ProductCreate(name="fanta", stock=10, price=5))
+
+    assert stock(catalog) == {"coke": 3, "fanta": 10}
+    assert catalog.version() == catalog_fingerprint(session)
+    assert loads == []
@@ -0,0 +1,66 @@
+import pytest
+
+from src.agent.intent_parser import parse_intent
+
+PRODUCTS = ["coke", "fanta", "pepsi"]
+MIN_CONFIDENCE = 0.85
+
+
+def orders(intent):
+    return {order.soda_name: order.quantity for order in intent.orders}
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        ("buy 2 cokes", {"coke": 2}),
+        ("i want one fanta and two pepsis", {"fanta": 1, "pepsi": 2}),
+        ("buy 3 fanta and 1 pepsi", {"fanta": 3, "pepsi": 1}),
+        ("2 cokes and 1 fanta", {"coke": 2, "fanta": 1}),
+        ("3 pepsis please", {"pepsi": 3}),
+    ],
+)
+def test_simple_orders_take_the_fast_path(message, expected):
+    intent, confidence = parse_intent(message, PRODUCTS)
+    assert intent.action == "buy"
+    assert orders(intent) == expected
+    assert confidence >= MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "I would like to get a coke and also some sprite please",
+        "can i get a coke and some water please",
+        "a coke and some lemonade",
+        "I have 2 cokes already, want a fanta",
+        "i have 3 pepsis already",
+        "I like coke",
+    ],
+)
+def test_orders_with_unknown_words_go_to_the_llm(message):
+    intent, confidence = parse_intent(message, PRODUCTS)
+    assert intent is None
+    assert confidence < MIN_CONFIDENCE
+
+
+@pytest.mark.parametrize(
+    "message",
+    [
+        "pepsi",
+        "coke?",
+        "what is coke",
+        "which is cheaper, coke or pepsi",
+        "2 cokes?",
+        "coke and fanta",
+    ],
+)
+def test_naming_a_product_is_not_an_order(message):
+    intent, _ = parse_intent(message, PRODUCTS)
+    assert intent is None
+
+
+@pytest.mark.parametrize("message", ["buy 0 cokes", "0 fanta", "i want zero pepsi and 2 cokes"])
+def test_zero_quantity_is_never_sold(message):
+    intent, _ = parse_intent(message, PRODUCTS)
+    assert intent is None
@@ -0,0 +1,84 @@
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+from sqlmodel import Session, select
+
+from src.models import (
+    Product, Sale, catalog_fingerprint, engine, migrate_product_version, migrate_sale_quantity,
+    sales_totals_from_sales,
+)
+
+
+def create_unit_sales(session, rows):
+    """The sale table as it was before the quantity column, one row per unit sold."""
+    session.exec(text("DROP TABLE sale"))
+    session.exec(text(
+        "CREATE TABLE sale (id INTEGER PRIMARY KEY, product_id INTEGER NOT NULL REFERENCES product (id), "
+        "timestamp DATETIME NOT NULL)"
+    ))
+    for sale_id, product_id, timestamp in rows:
+        session.exec(
+            text("INSERT INTO sale (id, product_id, timestamp) VALUES (:id, :product_id, :timestamp)"),
+            params={"id": sale_id, "product_id": product_id, "timestamp": timestamp},
+        )
+    session.commit()
+    # pooled connections may still hold the old table definition
+    engine.dispose()
+
+
+def test_migration_merges_unit_rows_into_order_lines(session):
+    session.add_all([Product(id=1, name="coke", stock=10, price=5), Product(id=2, name="fanta", stock=10, price=5)])
+    session.commit()
+    t = datetime(2024, 5, 1, 12, 0, 0)
+    micro = timedelta(microseconds=50)
+    create_unit_sales(session, [
+        (1, 1, t), (2, 1, t + micro), (3, 1, t + 2 * micro),     # one order of three cokes
+        (4, 2, t + 3 * micro),                                    # a fanta in between
+        (5, 1, t + 4 * micro), (6, 1, t + 5 * micro),             # two more cokes
+        (7, 1, t + timedelta(seconds=5)),                         # a later, separate order
+    ])
+
+    migrate_sale_quantity()
+
+    with Session(engine) as check:
+        rows = check.exec(select(Sale.id, Sale.product_id, Sale.quantity).order_by(Sale.id)).all()
+        assert [tuple(row) for row in rows] == [(1, 1, 3), (4, 2, 1), (5, 1, 2), (7, 1, 1)]
+        assert sales_totals_from_sales(check) == {1: 6, 2: 1}
+
+
+def test_migration_runs_only_once(session):
+    session.add(Product(id=1, name="coke", stock=10, price=5))
+    session.commit()
+    t = datetime(2024, 5, 1, 12, 0, 0)
+    create_unit_sales(session, [(1, 1, t), (2, 1, t)])
+    migrate_sale_quantity()
+
+    # rows written after the migration look like per-unit runs, but must be left alone
+    now = datetime.now(timezone.utc)
+    with Session(engine) as later:
+        later.add_all([Sale(id=10, product_id=1, quantity=1, timestamp=now), Sale(id=11, product_id=1, quantity=1, timestamp=now)])
+        later.commit()
+    migrate_sale_quantity()
+
+    with Session(engine) as check:
+        rows = check.exec(select(Sale.id, Sale.quantity).order_by(Sale.id)).all()
+        assert [tuple(row) for row in rows] == [(1, 2), (10, 1), (11, 1)]
+
+
+def test_product_version_migration_starts_every_row_at_one(session):
+    session.exec(text("DROP TABLE productsales"))
+    session.exec(text("DROP TABLE product"))
+    session.exec(text(
+        "CREATE TABLE product (id INTEGER PRIMARY KEY, name VARCHAR NOT NULL UNIQUE, stock INTEGER NOT NULL, "
+        "price INTEGER NOT NULL)"
+    ))
+    session.exec(text("INSERT INTO product (id, name, stock, price) VALUES (1, 'coke', 10, 5), (2, 'fanta', 3, 5)"))
+    session.commit()
+    engine.dispose()
+
+    migrate_product_version()
+    migrate_product_version()
+
+    with Session(engine) as check:
+        assert check.exec(select(Product.id, Product.version).order_by(Product.id)).all() == [(1, 1), (2, 1)]
+        assert catalog_fingerprint(check) == (2, 2)
@@ -0,0 +1,63 @@
+import pytest
+from sqlmodel import select
+
+from src.models import Product, ProductCreate, ProductSales, Sale, SaleCreate, check_sales_aggregate
+from src.services import create_product, place_order
+
+NOT_PLACED = "Not placed because another item in the order failed"
+
+
+@pytest.fixture
+def stocked(session):
+    create_product(session, ProductCreate(name="coke", stock=5, price=5))
+    create_product(session, ProductCreate(name="fanta", stock=10, price=5))
+    return session
+
+
+def snapshot(session):
+    session.expire_all()
+    stock = {p.name: p.stock for p in session.exec(select(Product)).all()}
+    sales = session.exec(select(Sale)).all()
+    totals = {row.product_id: row.total_sold for row in session.exec(select(ProductSales)).all()}
+    return stock, len(sales), totals
+
+
+def results(batch):
+    return [(line.product_name, line.success, line.detail) for line in batch.lines]
+
+
+def test_order_with_a_line_short_of_stock_changes_nothing(stocked):
+    before = snapshot(stocked)
+    batch = place_order(stocked, [SaleCreate(product_name="fanta", quantity=3), SaleCreate(product_name="coke", quantity=6)])
+    assert not batch.success
+    assert results(batch) == [
+        ("fanta", False, NOT_PLACED),
+        ("coke", False, "Not enough stock to fulfill the sale"),
+    ]
+    assert snapshot(stocked) == before
+
+
+def test_lines_of_one_product_are_checked_against_its_stock_together(stocked):
+    before = snapshot(stocked)
+    batch = place_order(stocked, [SaleCreate(product_name="coke", quantity=3), SaleCreate(product_name="coke", quantity=3)])
+    assert not batch.success
+    assert all(detail == "Not enough stock to fulfill the sale" for _, _, detail in results(batch))
+    assert snapshot(stocked) == before
+
+
+def test_order_with_an_unknown_product_changes_nothing(stocked):
+    before = snapshot(stocked)
+    batch = place_order(stocked, [SaleCreate(product_name="coke", quantity=1), SaleCreate(product_name="sprite", quantity=1)])
+    assert not batch.success
+    assert results(batch) == [("coke", False, NOT_PLACED), ("sprite", False, "Product not found")]
+    assert snapshot(stocked) == before
+
+
+def test_order_that_fits_is_placed_in_full(stocked):
+    batch = place_order(stocked, [SaleCreate(product_name="coke", quantity=5), SaleCreate(product_name="fanta", quantity=2)])
+    assert batch.success
+    assert [(line.product_name, line.success, line.sale.quantity) for line in batch.lines] == [("coke", True, 5), ("fanta", True, 2)]
+    stock, sales, _ = snapshot(stocked)
+    assert stock == {"coke": 0, "fanta": 8}
+    assert sales == 2
+    assert check_sales_aggregate(stocked).consistent
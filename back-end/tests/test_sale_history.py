@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src import app
+from src.models import Product, Sale
+from src.services import InvalidRequestError, sale_history, sale_history_page
+
+T0 = datetime(2024, 5, 1, 12, 0, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def sales(session):
+    """Ten sales over three timestamps, inserted out of order so id order differs from time order."""
+    session.add(Product(id=1, name="coke", stock=100, price=5))
+    session.add_all([
+        Sale(id=sale_id, product_id=1, quantity=1, timestamp=T0 + timedelta(minutes=minutes))
+        for sale_id, minutes in [(1, 10), (2, 0), (3, 0), (4, 10), (5, 0), (6, 20), (7, 0), (8, 10), (9, 20), (10, 0)]
+    ])
+    session.commit()
+    return session
+
+
+def all_pages(session, limit, **filters):
+    ids, cursor = [], None
+    while True:
+        page = sale_history_page(session, limit=limit, cursor=cursor, **filters)
+        ids.extend(sale.id for sale in page.items)
+        cursor = page.next_cursor
+        if cursor is None:
+            return ids
+
+
+@pytest.mark.parametrize("limit", [1, 2, 3, 4, 10, 50])
+def test_pages_through_shared_timestamps_without_gaps_or_duplicates(sales, limit):
+    assert all_pages(sales, limit) == [2, 3, 5, 7, 10, 1, 4, 8, 6, 9]
+
+
+def test_start_and_end_bound_pages_and_full_history(sales):
+    start, end = T0 + timedelta(minutes=10), T0 + timedelta(minutes=20)
+    assert all_pages(sales, 2, start=start, end=end) == [1, 4, 8]
+    assert [sale.id for sale in sale_history(sales, start, end)] == [1, 4, 8]
+    # a naive bound is taken as UTC
+    assert all_pages(sales, 2, start=start.replace(tzinfo=None)) == [1, 4, 8, 6, 9]
+
+
+def test_last_page_has_no_cursor(sales):
+    assert sale_history_page(sales, limit=10).next_cursor is None
+    assert sale_history_page(sales, limit=9).next_cursor is not None
+
+
+@pytest.mark.parametrize("cursor", ["not-a-cursor", "e30=", "eyJ0cyI6ICJ4IiwgImlkIjogMX0="])
+def test_malformed_cursor_is_rejected(sales, cursor):
+    with pytest.raises(InvalidRequestError):
+        sale_history_page(sales, cursor=cursor)
+    response = TestClient(app).get("/sales/history/page/", params={"cursor": cursor})
+    assert response.status_code == 400
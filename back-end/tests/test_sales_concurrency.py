@@ -0,0 +1,50 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from sqlmodel import Session, func, select
+
+from src import services
+from src.models import Product, ProductCreate, Sale, SaleCreate, check_sales_aggregate, engine
+
+STOCK = 50
+PURCHASES = 200
+
+
+def purchase(lines):
+    with Session(engine) as session:
+        batch = services.place_order(session, lines)
+    return batch.success
+
+
+def totals(session, product_id):
+    stock = session.exec(select(Product.stock).where(Product.id == product_id)).one()
+    sold = session.exec(select(func.coalesce(func.sum(Sale.quantity), 0)).where(Sale.product_id == product_id)).one()
+    return stock, sold
+
+
+def test_parallel_purchases_never_oversell(session):
+    product = services.create_product(session, ProductCreate(name="coke", stock=STOCK, price=1))
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        outcomes = list(pool.map(purchase, [[SaleCreate(product_name="coke", quantity=1)]] * PURCHASES))
+
+    stock, sold = totals(session, product.id)
+    assert outcomes.count(True) == STOCK
+    assert (sold, stock) == (STOCK, 0)
+    assert check_sales_aggregate(session).consistent
+
+
+def test_parallel_multi_line_orders_never_oversell(session):
+    coke = services.create_product(session, ProductCreate(name="coke", stock=STOCK, price=1))
+    fanta = services.create_product(session, ProductCreate(name="fanta", stock=STOCK * 2, price=1))
+    order = [SaleCreate(product_name="coke", quantity=1), SaleCreate(product_name="fanta", quantity=3)]
+    with ThreadPoolExecutor(max_workers=32) as pool:
+        outcomes = list(pool.map(purchase, [order] * PURCHASES))
+
+    placed = outcomes.count(True)
+    coke_stock, coke_sold = totals(session, coke.id)
+    fanta_stock, fanta_sold = totals(session, fanta.id)
+    assert coke_sold + coke_stock == STOCK and coke_stock >= 0
+    assert fanta_sold + fanta_stock == STOCK * 2 and fanta_stock >= 0
+    # an order takes both lines or neither
+    assert (coke_sold, fanta_sold) == (placed, placed * 3)
+    assert placed == (STOCK * 2) // 3
+    assert check_sales_aggregate(session).consistent
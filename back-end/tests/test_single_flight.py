@@ -0,0 +1,66 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.agent.ai_agent import LLM
+from src.agent.models import FreeChat
+from src.agent.utils.budget import BudgetExhausted, RequestBudget, current_budget
+
+
+def slow_llm(seconds: float):
+    """An LLM whose model call takes `seconds` and records one attempt, as instructor's hooks would."""
+    llm = LLM()
+    calls = []
+
+    async def create(**kwargs):
+        calls.append(kwargs)
+        llm._count_call()
+        await asyncio.sleep(seconds)
+        return FreeChat(message="hi")
+
+    llm.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    return llm, calls
+
+
+async def ask(llm: LLM, budget: RequestBudget, delay: float = 0.0):
+    await asyncio.sleep(delay)
+    current_budget.set(budget)
+    return await llm.send(FreeChat, "hello")
+
+
+def test_a_short_deadline_does_not_fail_the_callers_sharing_its_call():
+    async def main():
+        llm, calls = slow_llm(0.3)
+        starter, follower = RequestBudget(deadline_seconds=0.1), RequestBudget(deadline_seconds=5)
+        results = await asyncio.gather(ask(llm, starter), ask(llm, follower, 0.01), return_exceptions=True)
+        return llm, calls, starter, follower, results
+
+    llm, calls, starter, follower, (first, second) = asyncio.run(main())
+    assert isinstance(first, BudgetExhausted) and starter.exhausted_reason == "deadline"
+    assert second == FreeChat(message="hi") and follower.exhausted_reason is None
+    assert len(calls) == 1 and llm.single_flight.coalesced == 1
+    # the shared call ran on the defaults, not on the starter's 0.1s
+    assert calls[0]["timeout"] == llm.timeout and calls[0]["max_retries"] == llm.max_retries
+
+
+def test_the_caller_that_started_the_call_is_charged_for_it():
+    async def main():
+        llm, _ = slow_llm(0.2)
+        starter, follower = RequestBudget(deadline_seconds=5), RequestBudget(deadline_seconds=0.05)
+        results = await asyncio.gather(ask(llm, starter), ask(llm, follower, 0.01), return_exceptions=True)
+        return starter, follower, results
+
+    starter, follower, (first, second) = asyncio.run(main())
+    assert first == FreeChat(message="hi") and starter.calls == 1
+    assert isinstance(second, BudgetExhausted) and follower.calls == 0
+
+
+def test_an_exhausted_budget_never_joins_a_call():
+    async def main():
+        llm, calls = slow_llm(0.0)
+        with pytest.raises(BudgetExhausted):
+            await ask(llm, RequestBudget(max_calls=0))
+        return calls
+
+    assert asyncio.run(main()) == []
@@ -101,7 +101,7 @@ function App() {
 
     try {
       // Send message to API
-      const response = await sendMessage(content);
+      const response = await sendMessage(content, currentConversationId);
 
       // Add AI response
       const aiMessage: Message = {
@@ -15,6 +15,7 @@ export interface Conversation {
 
 export interface ApiRequest {
   message: string;
+  session_id?: string;
 }
 
 export interface ApiResponse {
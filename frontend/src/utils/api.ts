@@ -2,14 +2,14 @@ import type { ApiRequest, ApiResponse } from '../types/chat';
 
 const API_BASE_URL = import.meta.env.VITE_API_BASE_URL || 'http://localhost:8000';
 
-export const sendMessage = async (message: string): Promise<string> => {
+export const sendMessage = async (message: string, sessionId?: string): Promise<string> => {
   try {
     const response = await fetch(`${API_BASE_URL}/ask/`, {
       method: 'POST',
       headers: {
         'Content-Type': 'application/json',
       },
-      body: JSON.stringify({ message } as ApiRequest),
+      body: JSON.stringify({ message, session_id: sessionId } as ApiRequest),
     });
 
     if (!response.ok) {